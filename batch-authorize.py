@@ -0,0 +1,209 @@
+# This script measures how the Permission API scales with the number of items
+# in a single /api/permission/authorize request, the way the catalog frontend
+# batches its checks. For every batch size it sends requests whose items carry
+# resourceRefs sampled from a generated org, then prints the latency and the
+# items evaluated per second against the batch size, so the point where batch
+# evaluation stops scaling is visible.
+#
+# The entity refs come from the SQLite index of graph_store.py, refreshed first,
+# so an org that was indexed before is not parsed again.
+#
+# Example of how to run the script:
+# token=<your_token> python batch-authorize.py catalog-entities/extreme-org/all.local.yaml
+# python batch-authorize.py catalog-entities/extreme-org/all.local.yaml --token <your_token> --batch-sizes 1,10,100,1000 --requests 50 --output curve.csv
+import os
+import csv
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+import aiohttp
+
+from graph_store import GraphStore, DATABASE_NAME
+from rbac_oracle import default_policy_file
+from latency_histogram import LatencyRecorder
+from request_tracing import RequestPhases, trace_config, record_phases, format_phases
+
+BASE_URL = "http://localhost:7007"
+AUTHORIZE_PATH = "/api/permission/authorize"
+DEFAULT_BATCH_SIZES = "1,10,100,1000"
+DEFAULT_REQUESTS = 20
+DEFAULT_WARMUP = 2
+CURVE_FIELDS = ["batch_size", "requests", "items", "seconds", "requests_per_second", "items_per_second", "mean", "p50", "p90", "p99", "max", "allow", "deny"]
+
+latency_recorder = LatencyRecorder()
+
+def load_refs(catalog, kinds, database=None, policy=None):
+    folder = catalog if os.path.isdir(catalog) else os.path.dirname(catalog)
+    with GraphStore(database or os.path.join(folder, DATABASE_NAME)) as store:
+        # Refreshed with the policy, as graph_store.py does, so a shared index keeps its roles
+        store.refresh(catalog, policy)
+        return store.entity_refs(kinds)
+
+def batch_payload(refs, args):
+    return json.dumps({
+        "items": [
+            {
+                "id": str(uuid.uuid4()),
+                "permission": {
+                    "attributes": {"action": args.action},
+                    "name": args.permission,
+                    "type": "resource",
+                    "resourceType": args.resource_type,
+                },
+                "resourceRef": ref,
+            }
+            for ref in refs
+        ]
+    })
+
+def sample_batch(refs, size, rng):
+    # Distinct refs while the org has enough of them
+    return rng.sample(refs, size) if size <= len(refs) else rng.choices(refs, k=size)
+
+async def authorize(session, args, payload, size, record=True):
+    """POST one batch, return the count of every decision in the response."""
+    phases = RequestPhases()
+    async with session.post(
+        f"{args.base_url}{AUTHORIZE_PATH}",
+        headers={
+            "Authorization": f"Bearer {args.token}",
+            "Content-Type": "application/json"
+        },
+        data=payload,
+        ssl=None if args.verify_ssl else False,
+        trace_request_ctx=phases
+    ) as response:
+        if response.status == 401:
+            print("ERROR: Update token!")
+            sys.exit(1)
+        if response.status != 200:
+            print(f"Unexpected error. Status code is {response.status}.")
+            print(await response.text())
+            sys.exit(1)
+        body = await response.read()
+        phases.mark("body_end")
+        items = json.loads(body)["items"]
+        phases.mark("json_end")
+
+    if len(items) != size:
+        print(f"Expected {size} results, got {len(items)}")
+    if record:
+        endpoint = f"authorize x{size}"
+        latency_recorder.record(endpoint, record_phases(latency_recorder, endpoint, phases))
+    return Counter(item.get("result") for item in items)
+
+async def run_batch_size(session, args, refs, size, rng):
+    """Send the requests of one batch size, at most `--concurrency` at a time, and summarize them."""
+    # Payloads are built before the clock starts
+    payloads = [batch_payload(sample_batch(refs, size, rng), args) for _ in range(args.warmup + args.requests)]
+    for payload in payloads[:args.warmup]:
+        await authorize(session, args, payload, size, record=False)
+
+    slots = asyncio.Semaphore(args.concurrency)
+    decisions = Counter()
+
+    async def send(payload):
+        async with slots:
+            decisions.update(await authorize(session, args, payload, size))
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[send(payload) for payload in payloads[args.warmup:]])
+    elapsed = time.perf_counter() - start_time
+
+    summary = latency_recorder.histogram(f"authorize x{size}").summary()
+    return {
+        "batch_size": size,
+        "requests": args.requests,
+        "items": args.requests * size,
+        "seconds": elapsed,
+        "requests_per_second": args.requests / elapsed if elapsed > 0 else 0.0,
+        "items_per_second": args.requests * size / elapsed if elapsed > 0 else 0.0,
+        "mean": summary["mean"],
+        "p50": summary["p50"],
+        "p90": summary["p90"],
+        "p99": summary["p99"],
+        "max": summary["max"],
+        "allow": decisions.get("ALLOW", 0),
+        "deny": decisions.get("DENY", 0),
+    }
+
+async def run_curve(args, refs):
+    rng = random.Random(args.seed)
+    curve = []
+    async with aiohttp.ClientSession(trace_configs=[trace_config()]) as session:
+        for size in args.batch_sizes:
+            print(f"Sending {args.requests} requests of {size} items...")
+            curve.append(await run_batch_size(session, args, refs, size, rng))
+    return curve
+
+def print_curve(curve):
+    print("-" * 95)
+    print(f"{'items':>6} {'p50 s':>8} {'p90 s':>8} {'p99 s':>8} {'max s':>8} {'req/s':>8} {'items/s':>10} {'ms/item':>8}  {'allow/deny'}")
+    for row in curve:
+        per_item = row["mean"] / row["batch_size"] * 1000
+        print(f"{row['batch_size']:>6} {row['p50']:>8.3f} {row['p90']:>8.3f} {row['p99']:>8.3f} {row['max']:>8.3f} {row['requests_per_second']:>8.1f} {row['items_per_second']:>10.1f} {per_item:>8.3f}  {row['allow']}/{row['deny']}")
+    print("-" * 95)
+    for row in curve:
+        endpoint = f"authorize x{row['batch_size']}"
+        print(f"Phases of {row['batch_size']} items: {format_phases(latency_recorder, endpoint)}")
+
+def write_curve(curve, output):
+    if output.endswith(".json"):
+        with open(output, "w") as file:
+            json.dump({"curve": curve, "histograms": latency_recorder.to_dict()}, file, indent=2)
+    else:
+        with open(output, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=CURVE_FIELDS)
+            writer.writeheader()
+            writer.writerows(curve)
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and items/sec of batched Permission API checks against the batch size.")
+    parser.add_argument("catalog", help="Top level Location file or folder of the org the resourceRefs are sampled from")
+    parser.add_argument("--batch-sizes", default=DEFAULT_BATCH_SIZES, help=f"Comma separated numbers of items per request (default: {DEFAULT_BATCH_SIZES})")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help=f"Requests sent per batch size (default: {DEFAULT_REQUESTS})")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help=f"Requests sent per batch size before measuring (default: {DEFAULT_WARMUP})")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight at the same time (default: 1)")
+    parser.add_argument("--kinds", default="user,group", help="Kinds of the sampled entities (default: user,group)")
+    parser.add_argument("--permission", default="catalog.entity.read", help="Permission name (default: catalog.entity.read)")
+    parser.add_argument("--resource-type", default="catalog-entity", help="Permission resource type (default: catalog-entity)")
+    parser.add_argument("--action", default="read", help="Permission action (default: read)")
+    parser.add_argument("--base-url", default=BASE_URL, help=f"Backstage URL (default: {BASE_URL})")
+    parser.add_argument("--token", default=os.environ.get("token"), help="Bearer token (default: the `token` environment variable)")
+    parser.add_argument("--no-verify-ssl", dest="verify_ssl", action="store_false", help="Do not verify the TLS certificate of the backend")
+    parser.add_argument("--policy", help="RBAC policy CSV kept in the index (default: rbac-policy.csv next to the catalog, or in the current folder, if any)")
+    parser.add_argument("--database", help=f"SQLite index of the org (default: {DATABASE_NAME} next to the catalog)")
+    parser.add_argument("-s", "--seed", type=int, default=None, help="Seed for reproducible samples")
+    parser.add_argument("--output", help="Write the curve to this CSV file, or as JSON with the histograms when it ends in .json")
+    args = parser.parse_args()
+
+    if not args.token:
+        print("ERROR: pass --token or set the `token` environment variable")
+        sys.exit(1)
+    args.batch_sizes = [int(size) for size in args.batch_sizes.split(",") if size.strip()]
+
+    policy = args.policy or default_policy_file(args.catalog)
+    if args.policy and not os.path.exists(args.policy):
+        print(f"ERROR: policy file {args.policy} does not exist")
+        sys.exit(1)
+
+    kinds = [kind.strip().lower() for kind in args.kinds.split(",") if kind.strip()]
+    refs = load_refs(args.catalog, kinds, args.database, policy if os.path.exists(policy) else None)
+    if not refs:
+        print(f"ERROR: no entities found in {args.catalog}")
+        sys.exit(1)
+    print(f"Sampling resourceRefs from {len(refs)} entities")
+
+    curve = asyncio.run(run_curve(args, refs))
+    print_curve(curve)
+    if args.output:
+        write_curve(curve, args.output)
+
+if __name__ == "__main__":
+    main()
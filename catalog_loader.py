@@ -0,0 +1,69 @@
+import os
+import yaml
+
+# The libyaml C loader is an order of magnitude faster on large catalogs
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+def iter_catalog(path, missing=None):
+    """Yield (file, document) for every YAML document reachable from `path`.
+
+    `path` is either a Location file, whose targets are followed recursively
+    in the order they are listed, or a folder, in which case every `.yaml`
+    file below it is read. Every file is parsed once. Location targets that do
+    not exist are skipped, and appended to the `missing` list when given.
+    """
+    if os.path.isdir(path):
+        for directory, folders, files in os.walk(path):
+            folders[:] = sorted(folder for folder in folders if not folder.startswith("."))
+            for name in sorted(files):
+                if name.endswith((".yaml", ".yml")):
+                    catalog_file = os.path.join(directory, name)
+                    for document in iter_documents(catalog_file):
+                        yield catalog_file, document
+        return
+
+    pending = [os.path.abspath(path)]
+    seen = set()
+    while pending:
+        catalog_file = pending.pop()
+        if catalog_file in seen:
+            continue
+        seen.add(catalog_file)
+        if not os.path.isfile(catalog_file):
+            if missing is not None:
+                missing.append(catalog_file)
+            continue
+        targets = []
+        for document in iter_documents(catalog_file):
+            if document.get("kind") == "Location":
+                for target in document.get("spec", {}).get("targets", []):
+                    targets.append(os.path.normpath(os.path.join(os.path.dirname(catalog_file), target)))
+            yield catalog_file, document
+        pending.extend(reversed(targets))
+
+def iter_documents(path):
+    """Yield the non empty YAML documents of a single file."""
+    with open(path) as file:
+        for document in yaml.load_all(file, Loader=Loader):
+            if isinstance(document, dict):
+                yield document
+
+def iter_entities(path, kinds=("User", "Group")):
+    """Yield (file, entity) for every entity of `kinds` reachable from `path`."""
+    for catalog_file, document in iter_catalog(path):
+        if kinds is None or document.get("kind") in kinds:
+            yield catalog_file, document
+
+def entity_ref(value, default_kind):
+    """Normalize a (possibly shortened) entity reference to `kind:namespace/name`."""
+    value = str(value).lower()
+    kind, separator, rest = value.partition(":")
+    if not separator:
+        kind, rest = default_kind, value
+    if "/" not in rest:
+        rest = f"default/{rest}"
+    return f"{kind}:{rest}"
+
+def own_ref(entity):
+    metadata = entity.get("metadata", {})
+    return f"{entity['kind'].lower()}:{metadata.get('namespace', 'default')}/{metadata['name']}".lower()
@@ -0,0 +1,235 @@
+# This script describes the load shape of a catalog: how deep and wide its
+# group hierarchy is, how many users sit in every group, how many groups and
+# roles every user ends up with and how big the RBAC policy is. Record it next
+# to benchmark results so they can be compared between orgs.
+#
+# Works on generated orgs as well as hand-written ones such as test-org. The
+# YAML is streamed file by file, only the graph (references, no documents) is
+# kept and every distribution is a histogram, so memory stays bounded on 100k
+# entity catalogs.
+#
+# Example of how to run the script:
+# python catalog_profile.py catalog-entities/extreme-org/all.local.yaml --output profile.json
+# python catalog_profile.py catalog-entities/test-org --policy rbac-policy.csv
+import os
+import sys
+import json
+import time
+import argparse
+import operator
+from collections import Counter
+
+from catalog_loader import iter_catalog, own_ref
+from rbac_oracle import RbacOracle, close_over, default_policy_file
+
+PERCENTILES = (50, 90, 99)
+
+def summarize(histogram):
+    """min/mean/percentiles/max of a {value: count} histogram."""
+    total = sum(histogram.values())
+    if not total:
+        return {"count": 0}
+    summary = {
+        "count": total,
+        "min": min(histogram),
+        "mean": sum(value * count for value, count in histogram.items()) / total,
+    }
+    values = sorted(histogram.items())
+    for percentile in PERCENTILES:
+        rank = percentile / 100 * total
+        seen = 0
+        for value, count in values:
+            seen += count
+            if seen >= rank:
+                summary[f"p{percentile}"] = value
+                break
+    summary["max"] = values[-1][0]
+    return summary
+
+class CatalogProfile(RbacOracle):
+    """Shape of a catalog and of its policy, built on the graph the oracle loads."""
+
+    def __init__(self):
+        super().__init__()
+        self.kinds = Counter()
+        self.files = 0
+        self.bytes = 0
+        self.policy_rows = Counter()
+        self.role_bits = {}
+        self.closed_role_bits = {}
+        self.groups = set()
+        self.missing_files = []
+
+    def load_catalog(self, path):
+        seen = None
+        for catalog_file, document in iter_catalog(path, self.missing_files):
+            if catalog_file != seen:
+                seen = catalog_file
+                self.files += 1
+                self.bytes += os.path.getsize(catalog_file)
+            kind = document.get("kind")
+            self.kinds[kind] += 1
+            if kind in ("User", "Group"):
+                self.add_entity(document)
+                if kind == "Group":
+                    self.groups.add(own_ref(document))
+
+    def load_policy(self, path):
+        super().load_policy(path)
+        for subject, roles in self.bindings.items():
+            self.policy_rows[f"g {subject.partition(':')[0]} -> role"] += len(roles)
+        self.policy_rows["g role -> role"] = sum(len(parents) for parents in self.role_parents.values())
+        for name, masks in (("p allow", self.role_allow), ("p deny", self.role_deny)):
+            self.policy_rows[name] = sum(bin(mask).count("1") for mask in masks.values())
+        roles = set(self.role_allow) | set(self.role_deny) | set(self.role_parents)
+        for role_set in list(self.bindings.values()) + list(self.role_parents.values()):
+            roles.update(role_set)
+        self.role_bits = {role: 1 << index for index, role in enumerate(sorted(roles))}
+
+    def _role_bit(self, role):
+        return self.role_bits.get(role, 0)
+
+    def _closed_roles(self, role):
+        """Bitset of the role and of every role it inherits."""
+        return close_over(role, self.role_parents, self._role_bit, self.closed_role_bits, operator.or_)
+
+    def _bound_roles(self, subject):
+        bits = 0
+        for role in self.bindings.get(subject, ()):
+            bits |= self._closed_roles(role)
+        return bits
+
+    def group_depths(self):
+        """Longest parent chain of every group, roots being at depth 0."""
+        depths = {}
+        for group in self.groups:
+            if group in depths:
+                continue
+            stack = [(group, iter(self.group_parents.get(group, ())))]
+            on_path = {group}
+            while stack:
+                current, pending = stack[-1]
+                for parent in pending:
+                    # A parent already on the path closes a cycle and is not followed again
+                    if parent not in depths and parent not in on_path:
+                        stack.append((parent, iter(self.group_parents.get(parent, ()))))
+                        on_path.add(parent)
+                        break
+                else:
+                    stack.pop()
+                    on_path.discard(current)
+                    parents = [depths[parent] for parent in self.group_parents.get(current, ()) if parent in depths]
+                    depths[current] = max(parents) + 1 if parents else 0
+        return depths
+
+    def profile(self):
+        depths = self.group_depths()
+        children = Counter()
+        members = Counter()
+        for group in self.groups:
+            for parent in self.group_parents.get(group, ()):
+                children[parent] += 1
+        for groups in self.user_groups.values():
+            for group in groups:
+                members[group] += 1
+
+        transitive_groups = Counter()
+        reachable_roles = Counter()
+        for user, groups in self.user_groups.items():
+            visited = set()
+            stack = list(groups)
+            roles = self._bound_roles(user)
+            while stack:
+                group = stack.pop()
+                if group in visited:
+                    continue
+                visited.add(group)
+                roles |= self._bound_roles(group)
+                stack.extend(self.group_parents.get(group, ()))
+            transitive_groups[len(visited)] += 1
+            reachable_roles[bin(roles).count("1")] += 1
+
+        return {
+            "files": self.files,
+            "missing_files": len(self.missing_files),
+            "bytes": self.bytes,
+            "entities": dict(self.kinds),
+            "groups": {
+                "roots": sum(1 for group in self.groups if depths[group] == 0),
+                "depth": dict(sorted(Counter(depths[group] for group in self.groups).items())),
+                "fan_out": summarize(Counter(children[group] for group in self.groups)),
+                "members": summarize(Counter(members[group] for group in self.groups)),
+                "dangling_references": sum(1 for group in members if group not in self.groups),
+            },
+            "users": {
+                "direct_groups": summarize(Counter(len(groups) for groups in self.user_groups.values())),
+                "transitive_groups": summarize(transitive_groups),
+                "reachable_roles": summarize(reachable_roles),
+            },
+            "policy": {
+                "roles": len(self.role_bits),
+                "permission_pairs": len(self.bits),
+                "rows": dict(self.policy_rows),
+            },
+        }
+
+def format_summary(summary):
+    if not summary.get("count"):
+        return "-"
+    return " ".join(f"{name}={value:.1f}" if isinstance(value, float) else f"{name}={value}" for name, value in summary.items() if name != "count")
+
+def print_profile(profile):
+    print(f"- Files: {profile['files']} ({profile['bytes'] / 1e6:.1f} MB)")
+    if profile["missing_files"]:
+        print(f"- Location targets that do not exist: {profile['missing_files']}")
+    print(f"- Entities: {', '.join(f'{kind}: {count}' for kind, count in profile['entities'].items())}")
+    groups = profile["groups"]
+    print(f"- Root groups: {groups['roots']}")
+    print(f"- Groups per depth: {', '.join(f'{depth}: {count}' for depth, count in groups['depth'].items())}")
+    print(f"- Children per group: {format_summary(groups['fan_out'])}")
+    print(f"- Users per group: {format_summary(groups['members'])}")
+    if groups["dangling_references"]:
+        print(f"- Groups referenced by users but not in the catalog: {groups['dangling_references']}")
+    users = profile["users"]
+    print(f"- Direct groups per user: {format_summary(users['direct_groups'])}")
+    print(f"- Transitive groups per user: {format_summary(users['transitive_groups'])}")
+    if profile["policy"]:
+        policy = profile["policy"]
+        print(f"- Reachable roles per user: {format_summary(users['reachable_roles'])}")
+        print(f"- Roles: {policy['roles']}, permission/action pairs: {policy['permission_pairs']}")
+        print(f"- Policy rows: {', '.join(f'{name}: {count}' for name, count in policy['rows'].items())}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the load shape of a catalog and its RBAC policy.")
+    parser.add_argument("catalog", help="Top level Location file or folder of the catalog")
+    parser.add_argument("--policy", help="RBAC policy CSV (default: rbac-policy.csv next to the catalog, or in the current folder, if any)")
+    parser.add_argument("--output", help="Write the profile as JSON to this file")
+    args = parser.parse_args()
+
+    if args.policy is None:
+        args.policy = default_policy_file(args.catalog)
+        if not os.path.exists(args.policy):
+            args.policy = None
+    elif not os.path.exists(args.policy):
+        print(f"ERROR: policy file {args.policy} does not exist")
+        sys.exit(1)
+
+    start_time = time.perf_counter()
+    catalog_profile = CatalogProfile()
+    catalog_profile.load_catalog(args.catalog)
+    if args.policy:
+        catalog_profile.load_policy(args.policy)
+    profile = catalog_profile.profile()
+    profile["catalog"] = args.catalog
+    profile["policy_file"] = args.policy
+    if not args.policy:
+        profile["policy"] = None
+
+    print_profile(profile)
+    print(f"- Profiled in {time.perf_counter() - start_time:.2f} seconds")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(profile, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# This script checks the references between the Users and Groups of a catalog
+# before it is used for a performance run, so a broken fixture cannot skew the
+# results. Every problem is reported in one pass:
+# - files that cannot be parsed, entities without a kind or name
+# - entities defined more than once, repeated entries in children/members/memberOf
+# - unknown or missing spec fields (e.g. `parents` instead of `parent`)
+# - parent, children, members and memberOf references to entities that do not exist
+# - children lists that disagree with the parent of the listed group, or give
+#   it a second parent
+# - cycles in the parent chain
+#
+# Files are parsed in a process pool and only the references are sent back, so
+# 50k entity catalogs are checked in seconds.
+#
+# Example of how to run the script:
+# python catalog_validator.py catalog-entities/test-org
+# python catalog_validator.py catalog-entities/extreme-org/all.local.yaml --output problems.json
+import os
+import sys
+import json
+import time
+import difflib
+import argparse
+import multiprocessing
+from collections import Counter
+
+import yaml
+
+from catalog_loader import iter_documents, entity_ref, own_ref
+
+SPEC_FIELDS = {
+    "Group": {"required": {"type", "children"}, "optional": {"profile", "parent", "members"}},
+    "User": {"required": set(), "optional": {"profile", "memberOf"}},
+}
+CHUNK_SIZE = 16
+
+def parse_file(catalog_file):
+    """Parse a catalog file into compact entity records and the Location targets it lists."""
+    records = []
+    targets = []
+    problems = []
+    try:
+        for index, document in enumerate(iter_documents(catalog_file)):
+            kind = document.get("kind")
+            name = (document.get("metadata") or {}).get("name")
+            if kind == "Location":
+                folder = os.path.dirname(catalog_file)
+                targets += [os.path.normpath(os.path.join(folder, target)) for target in (document.get("spec") or {}).get("targets") or []]
+                continue
+            if kind not in SPEC_FIELDS:
+                continue
+            if not name:
+                problems.append(("error", "missing-name", catalog_file, f"{kind} document #{index + 1} has no metadata.name"))
+                continue
+            spec = document.get("spec") or {}
+            records.append({
+                "file": catalog_file,
+                "kind": kind,
+                "ref": own_ref(document),
+                "fields": sorted(spec),
+                "parent": entity_ref(spec["parent"], "group") if spec.get("parent") else None,
+                "children": [entity_ref(child, "group") for child in spec.get("children") or []],
+                "members": [entity_ref(member, "user") for member in spec.get("members") or []],
+                "memberOf": [entity_ref(group, "group") for group in spec.get("memberOf") or []],
+            })
+    except (OSError, yaml.YAMLError) as error:
+        problems.append(("error", "unreadable-file", catalog_file, str(error).splitlines()[0]))
+    return records, targets, problems
+
+class CatalogValidator:
+    """Index the entities of a catalog by reference and check the references between them."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.entities = {}
+        self.problems = []
+        self.files = 0
+
+    def report(self, severity, check, where, message):
+        self.problems.append((severity, check, where, message))
+
+    def load(self, path):
+        if os.path.isdir(path):
+            pending = []
+            for directory, folders, files in os.walk(path):
+                folders[:] = sorted(folder for folder in folders if not folder.startswith("."))
+                pending += [os.path.join(directory, name) for name in sorted(files) if name.endswith((".yaml", ".yml"))]
+        else:
+            pending = [os.path.abspath(path)]
+
+        seen = set(pending)
+        with multiprocessing.Pool(self.workers) as pool:
+            # Location files are parsed a level at a time, their targets make the next level
+            while pending:
+                next_level = []
+                for catalog_file in pending:
+                    if not os.path.isfile(catalog_file):
+                        self.report("error", "missing-file", catalog_file, "Location target does not exist")
+                for records, targets, problems in pool.imap(parse_file, [name for name in pending if os.path.isfile(name)], CHUNK_SIZE):
+                    self.files += 1
+                    self.problems += problems
+                    for record in records:
+                        self.index(record)
+                    for target in targets:
+                        if target not in seen:
+                            seen.add(target)
+                            next_level.append(target)
+                pending = next_level
+
+    def index(self, record):
+        ref = record["ref"]
+        previous = self.entities.get(ref)
+        if previous is not None:
+            self.report("error", "duplicate-entity", ref, f"defined in {previous['file']} and again in {record['file']}")
+            return
+        self.entities[ref] = record
+
+    def check_fields(self, record):
+        fields = SPEC_FIELDS[record["kind"]]
+        known = fields["required"] | fields["optional"]
+        for field in record["fields"]:
+            if field not in known:
+                suggestion = difflib.get_close_matches(field, known, n=1)
+                hint = f", did you mean '{suggestion[0]}'?" if suggestion else ""
+                self.report("error", "unknown-field", record["ref"], f"unknown spec field '{field}'{hint}")
+        for field in sorted(fields["required"] - set(record["fields"])):
+            self.report("error", "missing-field", record["ref"], f"missing required spec field '{field}'")
+
+    def check_list(self, record, field, kind):
+        ref = record["ref"]
+        for value, count in Counter(record[field]).items():
+            if count > 1:
+                self.report("error", "duplicate-reference", ref, f"{field} lists {value} {count} times")
+            target = self.entities.get(value)
+            if target is None:
+                self.report("error", "dangling-reference", ref, f"{field} references {value} which does not exist")
+            elif target["kind"] != kind:
+                self.report("error", "wrong-kind", ref, f"{field} references {value} which is a {target['kind']}")
+
+    def check_group(self, record):
+        ref = record["ref"]
+        parent = record["parent"]
+        if parent is not None:
+            target = self.entities.get(parent)
+            if target is None or target["kind"] != "Group":
+                self.report("error", "dangling-reference", ref, f"parent {parent} does not exist")
+            elif target["children"] and ref not in target["children"]:
+                self.report("warning", "asymmetric-children", ref, f"parent {parent} does not list it in its children")
+        for child in set(record["children"]):
+            target = self.entities.get(child)
+            if target is not None and target["parent"] not in (None, ref):
+                # Legal, the catalog gives the child both parents, but rarely intended
+                self.report("warning", "multiple-parents", ref, f"lists child {child} whose parent is {target['parent']}")
+
+    def check_cycles(self):
+        """Follow every parent chain once, reporting the chains that loop."""
+        state = {}
+        for ref, record in self.entities.items():
+            if record["kind"] != "Group" or ref in state:
+                continue
+            chain = []
+            current = ref
+            while current is not None and current not in state:
+                state[current] = "visiting"
+                chain.append(current)
+                target = self.entities.get(current)
+                current = target["parent"] if target is not None and target["kind"] == "Group" else None
+            if current is not None and state[current] == "visiting":
+                cycle = chain[chain.index(current):]
+                self.report("error", "parent-cycle", current, " -> ".join(cycle + [current]))
+            for visited in chain:
+                state[visited] = "done"
+
+    def validate(self):
+        for record in self.entities.values():
+            self.check_fields(record)
+            if record["kind"] == "Group":
+                self.check_group(record)
+                self.check_list(record, "children", "Group")
+                self.check_list(record, "members", "User")
+            else:
+                self.check_list(record, "memberOf", "Group")
+        self.check_cycles()
+        return self.problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the references between the Users and Groups of a catalog.")
+    parser.add_argument("catalog", help="Top level Location file or folder of the catalog")
+    parser.add_argument("-w", "--workers", type=int, help="Processes parsing the files (default: number of CPUs)")
+    parser.add_argument("--limit", type=int, default=20, help="Problems printed per check, 0 for all (default: 20)")
+    parser.add_argument("--output", help="Write every problem as JSON to this file")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    validator = CatalogValidator(args.workers)
+    validator.load(args.catalog)
+    problems = validator.validate()
+    elapsed = time.perf_counter() - start_time
+
+    printed = Counter()
+    for severity, check, where, message in problems:
+        printed[check] += 1
+        if not args.limit or printed[check] <= args.limit:
+            print(f"{severity.upper()} [{check}] {where}: {message}")
+    for check, count in printed.items():
+        if args.limit and count > args.limit:
+            print(f"... {count - args.limit} more [{check}] problems")
+
+    errors = sum(1 for problem in problems if problem[0] == "error")
+    print(f"- Checked {len(validator.entities)} entities in {validator.files} files in {elapsed:.2f} seconds: {errors} errors, {len(problems) - errors} warnings")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump([dict(zip(("severity", "check", "entity", "message"), problem)) for problem in problems], file, indent=2)
+    if errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
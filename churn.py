@@ -0,0 +1,278 @@
+# This script applies a day of churn to a generated org, so incremental catalog
+# processing and RBAC cache convergence can be benchmarked and not only cold
+# ingestion. Users are added and removed, groups re-parented and role bindings
+# moved to other groups, then the old and new entities and policy rows are
+# compared with a sorted-key diff and only the files that changed are written.
+#
+# By default the org is updated in place, so a catalog that already ingested it
+# picks the changes up on its next refresh. The added and removed policy rows
+# are written next to the policy as rbac-policy-added.csv and
+# rbac-policy-removed.csv. Run it again for the next day.
+#
+# Example of how to run the script:
+# python churn.py catalog-entities/extreme-org/all.local.yaml --add-users 1 --remove-users 1 --reparent-groups 0.5 --move-roles 0.5
+import os
+import csv
+import sys
+import json
+import time
+import random
+import argparse
+from collections import deque
+
+from catalog_loader import iter_catalog, entity_ref, own_ref
+from entity_writer import EntityWriter
+from serializers import SERIALIZERS, user_content, get_serializer
+from rbac_oracle import default_policy_file
+
+FRUITS = ["apple", "banana", "cherry", "grapefruit", "strawberry", "plum", "raspberry", "mango", "pineapple", "papaya", "blueberry", "pomegranate", "guava", "orange", "apricot", "watermelon", "peach", "pear", "blackberry", "lime", "date", "elderberry", "fig", "grape", "kiwi", "lemon", "cantaloupe", "melon", "breadfruit", "starfruit"]
+
+def sorted_diff(old_items, new_items):
+    """Merge two lists of (key, value) sorted by key into (key, old, new) for every difference."""
+    old_index = new_index = 0
+    while old_index < len(old_items) or new_index < len(new_items):
+        old = old_items[old_index] if old_index < len(old_items) else None
+        new = new_items[new_index] if new_index < len(new_items) else None
+        if new is None or (old is not None and old[0] < new[0]):
+            yield old[0], old[1], None
+            old_index += 1
+        elif old is None or new[0] < old[0]:
+            yield new[0], None, new[1]
+            new_index += 1
+        else:
+            if old[1] != new[1]:
+                yield old[0], old[1], new[1]
+            old_index += 1
+            new_index += 1
+
+class Org:
+    """The entities of a catalog grouped by the file they live in, in file order."""
+
+    def __init__(self, path):
+        self.root = path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path))
+        self.files = {}
+        self.entities = {}
+        self.file_of = {}
+        for catalog_file, document in iter_catalog(path):
+            self.files.setdefault(catalog_file, []).append(document)
+            if document.get("kind") in ("User", "Group"):
+                ref = own_ref(document)
+                self.entities[ref] = document
+                self.file_of[ref] = catalog_file
+
+    def refs(self, kind):
+        return sorted(ref for ref in self.entities if ref.startswith(f"{kind}:"))
+
+    def parent(self, ref):
+        parent = (self.entities[ref].get("spec") or {}).get("parent")
+        return entity_ref(parent, "group") if parent else None
+
+    def snapshot(self):
+        """(ref, canonical JSON of the entity) pairs sorted by ref."""
+        return sorted((ref, json.dumps(entity, sort_keys=True)) for ref, entity in self.entities.items())
+
+def short_ref(ref):
+    """The name the generators use in references, `group:default/x` -> `x`."""
+    return ref.split("/", 1)[1] if ref.split(":", 1)[1].startswith("default/") else ref
+
+def sample(items, percent):
+    count = round(len(items) * percent / 100)
+    return random.sample(items, min(count, len(items)))
+
+def remove_users(org, percent, policy):
+    removed = sample(org.refs("user"), percent)
+    for ref in removed:
+        del org.entities[ref]
+    removed_names = {short_ref(ref) for ref in removed}
+    for ref in org.refs("group"):
+        spec = org.entities[ref].get("spec") or {}
+        if any(short_ref(entity_ref(member, "user")) in removed_names for member in spec.get("members") or []):
+            spec["members"] = [member for member in spec["members"] if short_ref(entity_ref(member, "user")) not in removed_names]
+    removed_refs = set(removed)
+    policy[:] = [row for row in policy if not (row and row[0] == "g" and row[1].lower() in removed_refs)]
+    return len(removed)
+
+def add_users(org, percent):
+    users = org.refs("user")
+    added = 0
+    number = len(users)
+    for template_ref in sample(users, percent) if users else []:
+        template = org.entities[template_ref]
+        while True:
+            fruit = FRUITS[number % len(FRUITS)]
+            name = f"{fruit}_churn_{number}"
+            number += 1
+            if f"user:default/{name}" not in org.entities:
+                break
+        # The new user joins the teams of an existing one and goes into its file
+        member_of = list((template.get("spec") or {}).get("memberOf") or [])
+        ref = f"user:default/{name}"
+        org.entities[ref] = user_content(name, f"{name}@example.com", f"{fruit.capitalize()} churn {number - 1}", member_of)
+        org.file_of[ref] = org.file_of[template_ref]
+        added += 1
+    return added
+
+def descendants(children, ref):
+    """`ref` and every group below it, through the `children` index of the parents."""
+    found = {ref}
+    queue = deque([ref])
+    while queue:
+        for child in children.get(queue.popleft(), ()):
+            if child not in found:
+                found.add(child)
+                queue.append(child)
+    return found
+
+def reparent_groups(org, percent):
+    groups = org.refs("group")
+    children = {}
+    for group in groups:
+        parent = org.parent(group)
+        if parent:
+            children.setdefault(parent, set()).add(group)
+    moved = 0
+    for ref in sample([group for group in groups if org.parent(group)], percent):
+        old_parent = org.parent(ref)
+        # A group can not move below itself, and staying in place is no move
+        excluded = descendants(children, ref)
+        excluded.add(old_parent)
+        if len(excluded) * 2 < len(groups):
+            new_parent = random.choice(groups)
+            while new_parent in excluded:
+                new_parent = random.choice(groups)
+        else:
+            candidates = [group for group in groups if group not in excluded]
+            if not candidates:
+                continue
+            new_parent = random.choice(candidates)
+        spec = org.entities[ref]["spec"]
+        spec["parent"] = short_ref(new_parent)
+        children.get(old_parent, set()).discard(ref)
+        children.setdefault(new_parent, set()).add(ref)
+        # Keep explicit children lists in line with the parents
+        if old_parent in org.entities:
+            old_spec = org.entities[old_parent].get("spec") or {}
+            old_spec["children"] = [child for child in old_spec.get("children") or [] if entity_ref(child, "group") != ref]
+        new_spec = org.entities[new_parent].setdefault("spec", {})
+        if new_spec.get("children"):
+            new_spec["children"].append(short_ref(ref))
+        moved += 1
+    return moved
+
+def move_roles(org, percent, policy):
+    groups = org.refs("group")
+    bindings = [index for index, row in enumerate(policy) if row and row[0] == "g" and row[1].lower().startswith("group:")]
+    moved = sample(bindings, percent)
+    for index in moved:
+        policy[index] = ["g", random.choice(groups), policy[index][2]]
+    return len(moved)
+
+def read_policy(path):
+    with open(path, newline="") as file:
+        return [[field.strip() for field in row] for row in csv.reader(file)]
+
+def format_row(row):
+    # The spacing the generators use after every comma
+    return ", ".join(row)
+
+def policy_items(policy):
+    """Sorted ((row, occurrence), row) pairs of the non empty policy rows."""
+    counts = {}
+    items = []
+    for row in policy:
+        if row:
+            line = format_row(row)
+            counts[line] = counts.get(line, 0) + 1
+            items.append(((line, counts[line]), line))
+    return sorted(items)
+
+def write_policy(path, rows):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as file:
+        for row in rows:
+            file.write(format_row(row) + "\r\n" if row else "\r\n")
+
+def output_path(org, catalog_file, output):
+    if output is None:
+        return catalog_file
+    return os.path.join(output, os.path.relpath(catalog_file, org.root))
+
+def write_changed_files(org, old_refs, changed_files, serializer, output):
+    """Rewrite every changed file: its kept entities in order, then the ones added to it."""
+    added = {}
+    for ref, catalog_file in org.file_of.items():
+        if ref in org.entities and ref not in old_refs:
+            added.setdefault(catalog_file, []).append(org.entities[ref])
+    with EntityWriter(mode="w") as writer:
+        for catalog_file in sorted(changed_files):
+            # Entities changed in place are the same objects as the ones in org.files
+            documents = [document for document in org.files[catalog_file] if document.get("kind") not in ("User", "Group") or own_ref(document) in org.entities]
+            path = output_path(org, catalog_file, output)
+            # Opened up front so a file whose entities were all removed is emptied
+            writer.handle(path)
+            for document in documents + added.get(catalog_file, []):
+                writer.write_entity(path, serializer.dump(document))
+    return writer
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply churn to a generated org and write only what changed.")
+    parser.add_argument("catalog", help="Top level Location file or folder of the org")
+    parser.add_argument("--policy", help="RBAC policy CSV (default: rbac-policy.csv next to the catalog, or in the current folder)")
+    parser.add_argument("--add-users", type=float, default=1.0, help="Percentage of users to add (default: 1)")
+    parser.add_argument("--remove-users", type=float, default=1.0, help="Percentage of users to remove (default: 1)")
+    parser.add_argument("--reparent-groups", type=float, default=0.5, help="Percentage of groups to move under another parent (default: 0.5)")
+    parser.add_argument("--move-roles", type=float, default=0.5, help="Percentage of group role bindings to move to another group (default: 0.5)")
+    parser.add_argument("--output", help="Write the changed files under this folder instead of updating the org in place")
+    parser.add_argument("-s", "--seed", type=int, default=None, help="Seed for reproducible churn")
+    parser.add_argument("--serializer", choices=sorted(SERIALIZERS), default="yaml", help="Backend used to serialize the changed entities")
+    args = parser.parse_args()
+
+    policy_file = args.policy or default_policy_file(args.catalog)
+    if not os.path.exists(policy_file):
+        print(f"ERROR: policy file {policy_file} does not exist")
+        sys.exit(1)
+
+    random.seed(args.seed)
+    start_time = time.perf_counter()
+    org = Org(args.catalog)
+    policy = read_policy(policy_file)
+    old_entities = org.snapshot()
+    old_policy = policy_items(policy)
+    old_files = dict(org.file_of)
+
+    stats = {
+        "removed users": remove_users(org, args.remove_users, policy),
+        "added users": add_users(org, args.add_users),
+        "re-parented groups": reparent_groups(org, args.reparent_groups),
+        "moved role bindings": move_roles(org, args.move_roles, policy),
+    }
+
+    # Only the files holding an entity that was added, removed or changed are rewritten
+    changed_files = set()
+    changed_entities = 0
+    for ref, _, _ in sorted_diff(old_entities, org.snapshot()):
+        changed_entities += 1
+        changed_files.add(old_files.get(ref) or org.file_of[ref])
+    write_changed_files(org, old_files, changed_files, get_serializer(args.serializer), args.output)
+
+    added_rows = []
+    removed_rows = []
+    for _, old, new in sorted_diff(old_policy, policy_items(policy)):
+        if old is None:
+            added_rows.append(new.split(", "))
+        else:
+            removed_rows.append(old.split(", "))
+    policy_path = os.path.join(args.output, os.path.basename(policy_file)) if args.output else policy_file
+    write_policy(policy_path, policy)
+    folder = os.path.dirname(policy_path)
+    write_policy(os.path.join(folder, "rbac-policy-added.csv"), added_rows)
+    write_policy(os.path.join(folder, "rbac-policy-removed.csv"), removed_rows)
+
+    for name, count in stats.items():
+        print(f"- {name.capitalize()}: {count}")
+    print(f"- Changed entities: {changed_entities} in {len(changed_files)} of {len(org.files)} files")
+    print(f"- Policy rows added: {len(added_rows)}, removed: {len(removed_rows)}")
+    print(f"- Computed and written in {time.perf_counter() - start_time:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@ import sys
 import requests
 import time
 import os
+import argparse
+
+from latency_histogram import LatencyRecorder, format_summary
 
 AUTH_TOKEN = os.environ.get('token')
 
@@ -10,6 +13,11 @@ NUM_REQUESTS = 15
 NUM_REQUESTS_TWO = 10
 total_time = 0
 
+parser = argparse.ArgumentParser(description="Time sequential requests to the Permission API.")
+parser.add_argument("--output", help="Write the latency histogram as JSON to this file")
+args = parser.parse_args()
+latency_recorder = LatencyRecorder()
+
 for i in range(NUM_REQUESTS_TWO):
     total_time_inner = 0
     print(f"Iteration {i+1}:")
@@ -34,6 +42,7 @@ for i in range(NUM_REQUESTS_TWO):
 
         elapsed_time_inner = end_time_inner - start_time_inner
         total_time_inner += elapsed_time_inner
+        latency_recorder.record("permission", elapsed_time_inner)
 
     average_time_inner = total_time_inner / NUM_REQUESTS
     print(f"Average time taken to complete 1 request: {average_time_inner:.3f} seconds")
@@ -45,3 +54,6 @@ average_time_single_request = total_time / NUM_REQUESTS_TWO / NUM_REQUESTS
 print(f"Average time taken for a single request: {average_time_single_request:.3f} seconds")
 print(f"Average time taken for {NUM_REQUESTS} requests over {NUM_REQUESTS_TWO} iterations: {average_time:.3f} seconds")
 print(f"Total time taken for {NUM_REQUESTS} requests of {NUM_REQUESTS_TWO} iterations: {total_time:.3f} seconds")
+print(f"Latency: {format_summary(latency_recorder.histogram('permission').summary())}")
+if args.output:
+    latency_recorder.write_json(args.output)
@@ -0,0 +1,82 @@
+import os
+import time
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_MAX_OPEN_FILES = 256
+
+class EntityWriter:
+    """Keep one buffered handle per output file for the whole generation run.
+
+    Handles are opened on first use, flushed in `buffer_size` chunks and only
+    closed when the run ends (or when more than `max_open_files` are open, in
+    which case the least recently used handle is closed and later reopened in
+    append mode).
+    """
+
+    def __init__(self, mode="a", buffer_size=DEFAULT_BUFFER_SIZE, max_open_files=DEFAULT_MAX_OPEN_FILES):
+        self.mode = mode
+        self.pack_counts = {}
+        self.buffer_size = buffer_size
+        self.max_open_files = max_open_files
+        self.handles = {}
+        self.opened_files = set()
+        self.created_dirs = set()
+        self.entities = 0
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def handle(self, filename, newline=None):
+        """Return the open handle for `filename`, opening it on first use."""
+        handle = self.handles.pop(filename, None)
+        if handle is None:
+            if len(self.handles) >= self.max_open_files:
+                oldest = next(iter(self.handles))
+                self.handles.pop(oldest).close()
+            directory = os.path.dirname(filename)
+            if directory and directory not in self.created_dirs:
+                os.makedirs(directory, exist_ok=True)
+                self.created_dirs.add(directory)
+            mode = "a" if filename in self.opened_files else self.mode
+            handle = open(filename, mode, buffering=self.buffer_size, newline=newline)
+            self.opened_files.add(filename)
+        # Re-insert so the dict stays ordered from least to most recently used
+        self.handles[filename] = handle
+        return handle
+
+    def write_entity(self, filename, content):
+        """Append a single YAML document followed by the `---` separator."""
+        handle = self.handle(filename)
+        handle.write(content)
+        handle.write("---\n")
+        self.entities += 1
+
+    def write_packed(self, folder, stream, content, entities_per_file):
+        """Append an entity to the current pack file of `stream` inside `folder`.
+
+        A new pack file is started every `entities_per_file` entities. Returns
+        the pack file name, without folder and extension, the entity went to.
+        """
+        count = self.pack_counts.get((folder, stream), 0)
+        self.pack_counts[(folder, stream)] = count + 1
+        name = f"{stream}-{count // entities_per_file:05d}"
+        self.write_entity(f"{folder}/{name}.local.yaml", content)
+        return name
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.handles = {}
+        self.end_time = time.perf_counter()
+
+    def elapsed(self):
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    def entities_per_second(self):
+        elapsed = self.elapsed()
+        return self.entities / elapsed if elapsed > 0 else 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
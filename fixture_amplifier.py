@@ -0,0 +1,148 @@
+# This script scales the hand-written test-org fixtures, whose membership
+# patterns are shaped on purpose, by writing N renamed copies of them. Every
+# User and Group name gets a `-copy<N>` suffix, and so do the parent, parents,
+# children, members and memberOf references to them, so every copy has exactly
+# the topology of the original, quirks included, and no copy refers to
+# another one. References to names that the fixtures do not define are left
+# as they are.
+#
+# Placeholder entities such as `<YOUR_USER_NAME>` stand for the real login user
+# and are only kept in the original, the copies drop them and the references
+# to them.
+#
+# The copies are written to catalog-entities/test-org-copies/ with a Location
+# file listing them, which is added to the targets of
+# catalog-entities/all.local.yaml.
+#
+# Example of how to run the script:
+# python fixture_amplifier.py -n 100
+import os
+import re
+import copy
+import argparse
+
+import yaml
+
+from catalog_loader import iter_catalog
+from entity_writer import EntityWriter
+from serializers import SERIALIZERS, get_serializer
+
+SOURCE = "catalog-entities/test-org"
+OUTPUT = "catalog-entities/test-org-copies"
+CATALOG = "catalog-entities/all.local.yaml"
+REFERENCE_FIELDS = ("parent", "parents", "children", "members", "memberOf")
+PLACEHOLDER = re.compile(r"<.*>")
+
+def is_placeholder(name):
+    return bool(PLACEHOLDER.fullmatch(str(name)))
+
+def split_reference(reference):
+    """`group:default/x` -> (`group:default/`, `x`), `x` -> (``, `x`)."""
+    reference = str(reference)
+    prefix_end = reference.rfind("/") + 1 if ":" in reference or "/" in reference else 0
+    return reference[:prefix_end], reference[prefix_end:]
+
+class Amplifier:
+    """Renamed copies of the User and Group documents of a fixture folder."""
+
+    def __init__(self, source):
+        self.source = source
+        self.files = {}
+        for catalog_file, document in iter_catalog(source):
+            self.files.setdefault(catalog_file, []).append(document)
+        self.names = {
+            document["metadata"]["name"]
+            for documents in self.files.values() for document in documents
+            if document.get("kind") in ("User", "Group") and (document.get("metadata") or {}).get("name")
+        }
+
+    def rename(self, reference, suffix):
+        prefix, name = split_reference(reference)
+        return f"{prefix}{name}{suffix}" if name in self.names else reference
+
+    def copy_document(self, document, suffix):
+        """The document with its own name and its references suffixed, None for placeholders."""
+        name = (document.get("metadata") or {}).get("name")
+        if document.get("kind") not in ("User", "Group") or name is None:
+            return document
+        if is_placeholder(name):
+            return None
+        document = copy.deepcopy(document)
+        document["metadata"]["name"] = self.rename(name, suffix)
+        spec = document.get("spec") or {}
+        profile = spec.get("profile") or {}
+        if profile.get("displayName") == name:
+            profile["displayName"] = document["metadata"]["name"]
+        for field in REFERENCE_FIELDS:
+            value = spec.get(field)
+            if isinstance(value, list):
+                spec[field] = [self.rename(item, suffix) for item in value if not is_placeholder(split_reference(item)[1])]
+            elif value is not None and not is_placeholder(split_reference(value)[1]):
+                spec[field] = self.rename(value, suffix)
+        return document
+
+    def write(self, writer, serializer, output, copies):
+        """Write the copies, each with its own Location file, and the Location listing them."""
+        copy_locations = []
+        for number in range(1, copies + 1):
+            folder = os.path.join(output, f"copy-{number:03d}")
+            suffix = f"-copy{number}"
+            targets = []
+            for catalog_file, documents in self.files.items():
+                relative = os.path.relpath(catalog_file, self.source)
+                path = os.path.join(folder, relative)
+                # Opened up front so a file of placeholders only still exists
+                writer.handle(path)
+                for document in documents:
+                    if document.get("kind") == "Location":
+                        continue
+                    document = self.copy_document(document, suffix)
+                    if document is not None:
+                        writer.write_entity(path, serializer.dump(document))
+                targets.append(f"./{relative}")
+            writer.handle(os.path.join(folder, "all.local.yaml")).write(serializer.location(f"test-org-copy{number}", targets))
+            copy_locations.append(f"./copy-{number:03d}/all.local.yaml")
+        writer.handle(os.path.join(output, "all.local.yaml")).write(serializer.location("test-org-copies", copy_locations))
+
+def add_catalog_target(catalog, target):
+    """Append `target` to the Location in `catalog`, keeping the hand-written layout."""
+    with open(catalog) as file:
+        text = file.read()
+    location = yaml.safe_load(text)
+    targets = location.setdefault("spec", {}).setdefault("targets", [])
+    if target in targets:
+        return False
+    indent = next((line[:len(line) - len(line.lstrip())] for line in reversed(text.splitlines()) if line.lstrip().startswith("- ")), "  ")
+    updated = f"{text.rstrip()}\n{indent}- {target}\n"
+    # targets is the last key of the hand-written file, dump it again if that changes
+    if yaml.safe_load(updated) != {**location, "spec": {**location["spec"], "targets": targets + [target]}}:
+        targets.append(target)
+        updated = yaml.dump(location, sort_keys=False)
+    with open(catalog, "w") as file:
+        file.write(updated)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Write renamed, referentially consistent copies of the test-org fixtures.")
+    parser.add_argument("-n", "--copies", type=int, default=10, help="Number of copies to write (default: 10)")
+    parser.add_argument("--source", default=SOURCE, help=f"Fixture folder to copy (default: {SOURCE})")
+    parser.add_argument("--output", default=OUTPUT, help=f"Folder the copies are written to (default: {OUTPUT})")
+    parser.add_argument("--catalog", default=CATALOG, help=f"Location file the copies are added to, empty to leave it alone (default: {CATALOG})")
+    parser.add_argument("--serializer", choices=sorted(SERIALIZERS), default="yaml", help="Backend used to serialize the copies")
+    args = parser.parse_args()
+
+    amplifier = Amplifier(args.source)
+    with EntityWriter(mode="w") as writer:
+        amplifier.write(writer, get_serializer(args.serializer), args.output, args.copies)
+
+    if args.catalog:
+        target = f"./{os.path.relpath(os.path.join(args.output, 'all.local.yaml'), os.path.dirname(args.catalog))}"
+        if add_catalog_target(args.catalog, target):
+            print(f"- Added {target} to {args.catalog}")
+
+    print(f"- Fixture files: {len(amplifier.files)}, User and Group names: {len(amplifier.names)}")
+    print(f"- Copies written: {args.copies} to {args.output}")
+    print(f"- Entities written: {writer.entities} in {writer.elapsed():.2f} seconds")
+
+if __name__ == "__main__":
+    main()
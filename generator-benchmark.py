@@ -0,0 +1,145 @@
+# This script benchmarks the org generators (tree.py and hierarchy.py) across a
+# grid of parameters. Every run happens in a fresh temporary directory and the
+# wall time, entities/sec, peak RSS and output size are saved as JSON so the
+# results of two versions of the scripts can be compared.
+#
+# Example of how to run the script:
+# python generator-benchmark.py --output before.json
+# ... change the generators ...
+# python generator-benchmark.py --output after.json --compare before.json
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SEED = 1
+DEFAULT_THRESHOLD = 0.10
+
+def hierarchy_runs(args):
+    for roots, depth, users, level in itertools.product(args.roots, args.depth, args.users, args.level):
+        yield "hierarchy.py", {"root": roots, "hierarchy": depth, "users": users, "level": level}
+
+def tree_runs(args):
+    for roots, groups, users in itertools.product(args.roots, args.tree_groups, args.tree_users):
+        yield "tree.py", {"root": roots, "groups": groups, "users": users, "roles": roots}
+
+def measure_output(folder):
+    """Count the generated entities (every one is followed by `---`) and output bytes."""
+    entities = 0
+    size = 0
+    for directory, _, files in os.walk(folder):
+        if os.path.basename(directory) == ".cache":
+            continue
+        for name in files:
+            path = os.path.join(directory, name)
+            size += os.path.getsize(path)
+            if name.endswith(".yaml"):
+                with open(path) as file:
+                    entities += sum(1 for line in file if line == "---\n")
+    return entities, size
+
+def run_generator(script, params, args):
+    command = [sys.executable, os.path.join(SCRIPT_FOLDER, script), "--seed", str(args.seed)]
+    for name, value in params.items():
+        command += [f"--{name}", str(value)]
+    command += args.extra_args
+
+    with tempfile.TemporaryDirectory() as folder:
+        start_time = time.perf_counter()
+        process = subprocess.Popen(command, cwd=folder, stdout=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_time = time.perf_counter() - start_time
+        if status != 0:
+            print(f"ERROR: {' '.join(command)} exited with status {status}")
+            sys.exit(1)
+        entities, size = measure_output(folder)
+
+    return {
+        "script": script,
+        "params": params,
+        "wall_time": wall_time,
+        "entities": entities,
+        "entities_per_second": entities / wall_time,
+        # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+        "peak_rss_mb": usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        "output_bytes": size,
+    }
+
+def run_key(result):
+    return f"{result['script']} {json.dumps(result['params'], sort_keys=True)}"
+
+def compare(results, baseline_file, threshold):
+    """Print the runs that got slower or bigger than the baseline, return whether any did."""
+    with open(baseline_file) as file:
+        baseline = {run_key(result): result for result in json.load(file)["results"]}
+    regressed = False
+    for result in results:
+        previous = baseline.get(run_key(result))
+        if previous is None:
+            continue
+        for metric, higher_is_better in (("entities_per_second", True), ("peak_rss_mb", False)):
+            change = (result[metric] - previous[metric]) / previous[metric]
+            if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                regressed = True
+                print(f"REGRESSION {run_key(result)}: {metric} {previous[metric]:.1f} -> {result[metric]:.1f} ({change:+.0%})")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tree.py and hierarchy.py across a parameter grid.")
+    parser.add_argument("--generator", action="append", choices=["hierarchy", "tree"], help="Generator to benchmark, can be repeated (default: both)")
+    parser.add_argument("--roots", type=int, nargs="+", default=[2, 10], help="Number of root groups")
+    parser.add_argument("--depth", type=int, nargs="+", default=[5, 9], help="hierarchy.py levels per tree")
+    parser.add_argument("--users", type=int, nargs="+", default=[2, 10], help="hierarchy.py users per leaf group")
+    parser.add_argument("--level", type=int, nargs="+", default=[4], help="hierarchy.py level that carries the roles")
+    parser.add_argument("--tree-groups", type=int, nargs="+", default=[25, 250], help="tree.py groups per root")
+    parser.add_argument("--tree-users", type=int, nargs="+", default=[2000], help="tree.py users")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed passed to the generators so every run builds the same org")
+    parser.add_argument("--repeat", type=int, default=1, help="Run each point this many times and keep the fastest")
+    parser.add_argument("--output", default="generator-benchmark.json", help="File to write the results to")
+    parser.add_argument("--compare", help="Results of a previous run to check for regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative change counted as a regression (default: 0.10)")
+    parser.add_argument("extra_args", nargs=argparse.REMAINDER, help="Arguments after -- are passed to every generator run")
+    args = parser.parse_args()
+    if args.extra_args[:1] == ["--"]:
+        args.extra_args = args.extra_args[1:]
+
+    generators = args.generator or ["hierarchy", "tree"]
+    runs = []
+    if "hierarchy" in generators:
+        runs += list(hierarchy_runs(args))
+    if "tree" in generators:
+        runs += list(tree_runs(args))
+
+    print(f"{'script':<14}{'params':<55}{'seconds':>9}{'entities/sec':>14}{'peak MB':>9}{'output MB':>11}")
+    print("-" * 112)
+    results = []
+    for script, params in runs:
+        result = min((run_generator(script, params, args) for _ in range(args.repeat)), key=lambda result: result["wall_time"])
+        results.append(result)
+        params_text = " ".join(f"{name}={value}" for name, value in params.items())
+        print(f"{script:<14}{params_text:<55}{result['wall_time']:>9.2f}{result['entities_per_second']:>14.0f}{result['peak_rss_mb']:>9.1f}{result['output_bytes'] / 1e6:>11.1f}")
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=SCRIPT_FOLDER, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    with open(args.output, "w") as file:
+        json.dump({
+            "commit": commit,
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "extra_args": args.extra_args,
+            "results": results,
+        }, file, indent=2)
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
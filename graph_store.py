@@ -0,0 +1,312 @@
+# This script keeps a persistent SQLite index of a generated org: its
+# entities, parent edges, memberships, and the role bindings and permissions
+# of its rbac-policy.csv. Tools that need to reason about an org can query it
+# instead of reparsing every YAML file.
+#
+# The index is refreshed incrementally: a file whose mtime and size did not
+# change is skipped, one whose content hash did not change only gets its mtime
+# updated, and only the others are parsed again. Location targets are stored,
+# so reopening an already indexed org costs one stat per file.
+#
+# Example of how to run the script:
+# python graph_store.py catalog-entities/extreme-org/all.local.yaml --users-with-roles 3
+# python graph_store.py catalog-entities/extreme-org/all.local.yaml --leaf-groups 4 --sample 5 --cohort depth
+import os
+import csv
+import sys
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+from collections import Counter
+
+import yaml
+
+from catalog_loader import Loader, entity_ref, own_ref
+from rbac_oracle import default_policy_file
+
+DATABASE_NAME = ".cache/graph.sqlite"
+COHORTS = ["roles", "depth", "group"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, sha256 TEXT);
+CREATE TABLE IF NOT EXISTS locations (file TEXT, position INTEGER, target TEXT);
+CREATE TABLE IF NOT EXISTS entities (file TEXT, ref TEXT, kind TEXT);
+CREATE TABLE IF NOT EXISTS parents (file TEXT, child TEXT, parent TEXT);
+CREATE TABLE IF NOT EXISTS memberships (file TEXT, user TEXT, group_ref TEXT, position INTEGER);
+CREATE TABLE IF NOT EXISTS bindings (file TEXT, subject TEXT, role TEXT);
+CREATE TABLE IF NOT EXISTS role_parents (file TEXT, role TEXT, parent TEXT);
+CREATE TABLE IF NOT EXISTS permissions (file TEXT, role TEXT, permission TEXT, action TEXT, effect TEXT);
+CREATE INDEX IF NOT EXISTS locations_file ON locations (file);
+CREATE INDEX IF NOT EXISTS entities_file ON entities (file);
+CREATE INDEX IF NOT EXISTS entities_ref ON entities (ref);
+CREATE INDEX IF NOT EXISTS parents_file ON parents (file);
+CREATE INDEX IF NOT EXISTS parents_child ON parents (child);
+CREATE INDEX IF NOT EXISTS parents_parent ON parents (parent);
+CREATE INDEX IF NOT EXISTS memberships_file ON memberships (file);
+CREATE INDEX IF NOT EXISTS memberships_user ON memberships (user);
+CREATE INDEX IF NOT EXISTS bindings_file ON bindings (file);
+CREATE INDEX IF NOT EXISTS bindings_subject ON bindings (subject);
+CREATE INDEX IF NOT EXISTS role_parents_file ON role_parents (file);
+CREATE INDEX IF NOT EXISTS role_parents_role ON role_parents (role);
+CREATE INDEX IF NOT EXISTS permissions_file ON permissions (file);
+"""
+FILE_TABLES = ["locations", "entities", "parents", "memberships", "bindings", "role_parents", "permissions"]
+
+# Roles reachable by every user: through its own bindings, the groups it is a
+# member of and their ancestors, and the roles those roles inherit. UNION
+# keeps the recursion finite on parent and role cycles.
+USER_ROLES = """
+WITH RECURSIVE
+user_groups(user, grp) AS (
+    SELECT user, group_ref FROM memberships
+    UNION SELECT user_groups.user, parents.parent FROM user_groups JOIN parents ON parents.child = user_groups.grp
+),
+user_roles(user, role) AS (
+    SELECT user_groups.user, bindings.role FROM user_groups JOIN bindings ON bindings.subject = user_groups.grp
+    UNION SELECT entities.ref, bindings.role FROM entities JOIN bindings ON bindings.subject = entities.ref WHERE entities.kind = 'user'
+    UNION SELECT user_roles.user, role_parents.parent FROM user_roles JOIN role_parents ON role_parents.role = user_roles.role
+)
+"""
+# Longest parent chain of every group reachable from a root, cut at the number
+# of groups so a cycle below a root cannot recurse forever
+GROUP_DEPTHS = """
+WITH RECURSIVE depths(grp, depth) AS (
+    SELECT ref, 0 FROM entities WHERE kind = 'group' AND ref NOT IN (SELECT child FROM parents)
+    UNION SELECT parents.child, depths.depth + 1 FROM depths JOIN parents ON parents.parent = depths.grp
+    WHERE depths.depth < (SELECT COUNT(*) FROM entities WHERE kind = 'group')
+),
+group_depths(grp, depth) AS (SELECT grp, MAX(depth) FROM depths GROUP BY grp)
+"""
+
+def parse_catalog_file(data):
+    """Location targets and table rows of a catalog file, from its raw bytes."""
+    rows = {table: [] for table in FILE_TABLES}
+    for document in yaml.load_all(data, Loader=Loader):
+        if not isinstance(document, dict):
+            continue
+        kind = document.get("kind")
+        spec = document.get("spec") or {}
+        if kind == "Location":
+            for target in spec.get("targets") or []:
+                rows["locations"].append((len(rows["locations"]), target))
+            continue
+        if kind not in ("User", "Group") or not (document.get("metadata") or {}).get("name"):
+            continue
+        ref = own_ref(document)
+        rows["entities"].append((ref, kind.lower()))
+        if kind == "User":
+            for position, group in enumerate(spec.get("memberOf") or []):
+                rows["memberships"].append((ref, entity_ref(group, "group"), position))
+            continue
+        if spec.get("parent"):
+            rows["parents"].append((ref, entity_ref(spec["parent"], "group")))
+        for child in spec.get("children") or []:
+            rows["parents"].append((entity_ref(child, "group"), ref))
+        for member in spec.get("members") or []:
+            rows["memberships"].append((entity_ref(member, "user"), ref, -1))
+    return rows
+
+def parse_policy_file(data):
+    """Table rows of an RBAC policy CSV, from its raw bytes."""
+    rows = {table: [] for table in FILE_TABLES}
+    for row in csv.reader(data.decode().splitlines()):
+        row = [field.strip() for field in row]
+        if len(row) >= 3 and row[0] == "g":
+            subject, role = row[1].lower(), row[2].lower()
+            if subject.startswith("role:"):
+                rows["role_parents"].append((subject, role))
+            else:
+                rows["bindings"].append((subject, role))
+        elif len(row) >= 5 and row[0] == "p":
+            rows["permissions"].append((row[1].lower(), row[2], row[3], row[4].lower()))
+    return rows
+
+class GraphStore:
+    """SQLite index of the entities and policy of an org, refreshed file by file."""
+
+    def __init__(self, database):
+        directory = os.path.dirname(database)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript(SCHEMA)
+        self.stats = Counter()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self, path, policy=None):
+        """Bring the index up to date with the catalog at `path` and the `policy` CSV."""
+        self.stats = Counter()
+        reachable = set()
+        if os.path.isdir(path):
+            pending = []
+            for directory, folders, files in os.walk(path):
+                folders[:] = sorted(folder for folder in folders if not folder.startswith("."))
+                pending += [os.path.abspath(os.path.join(directory, name)) for name in sorted(files) if name.endswith((".yaml", ".yml"))]
+            pending.reverse()
+            follow = False
+        else:
+            pending = [os.path.abspath(path)]
+            follow = True
+
+        with self.connection:
+            while pending:
+                catalog_file = pending.pop()
+                if catalog_file in reachable:
+                    continue
+                reachable.add(catalog_file)
+                if not os.path.isfile(catalog_file):
+                    self.stats["missing"] += 1
+                    continue
+                self.refresh_file(catalog_file, parse_catalog_file)
+                if follow:
+                    folder = os.path.dirname(catalog_file)
+                    targets = self.connection.execute("SELECT target FROM locations WHERE file = ? ORDER BY position", (catalog_file,))
+                    pending.extend(reversed([os.path.normpath(os.path.join(folder, target)) for target, in targets]))
+            if policy is not None and os.path.isfile(policy):
+                policy = os.path.abspath(policy)
+                reachable.add(policy)
+                self.refresh_file(policy, parse_policy_file)
+
+            # Files that are no longer reachable from the catalog are dropped
+            for stale, in self.connection.execute("SELECT path FROM files").fetchall():
+                if stale not in reachable:
+                    self.forget(stale)
+                    self.stats["removed"] += 1
+        return self.stats
+
+    def refresh_file(self, path, parse):
+        stat = os.stat(path)
+        known = self.connection.execute("SELECT mtime_ns, size, sha256 FROM files WHERE path = ?", (path,)).fetchone()
+        if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            self.stats["unchanged"] += 1
+            return
+        with open(path, "rb") as file:
+            data = file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if known is not None and known[2] == digest:
+            # Touched but not modified
+            self.connection.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?", (stat.st_mtime_ns, stat.st_size, path))
+            self.stats["touched"] += 1
+            return
+        self.forget(path)
+        for table, rows in parse(data).items():
+            if rows:
+                columns = len(rows[0]) + 1
+                self.connection.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * columns)})", [(path, *row) for row in rows])
+        self.connection.execute("INSERT INTO files VALUES (?, ?, ?, ?)", (path, stat.st_mtime_ns, stat.st_size, digest))
+        self.stats["parsed"] += 1
+
+    def forget(self, path):
+        for table in FILE_TABLES:
+            self.connection.execute(f"DELETE FROM {table} WHERE file = ?", (path,))
+        self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def counts(self):
+        counts = dict(self.connection.execute("SELECT kind, COUNT(*) FROM entities GROUP BY kind"))
+        for table in ("parents", "memberships", "bindings", "permissions"):
+            counts[table] = self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return counts
+
+    def entity_refs(self, kinds=None):
+        """Sorted refs of the indexed entities, only of the given kinds (`user`, `group`) when set."""
+        if kinds:
+            rows = self.connection.execute(f"SELECT DISTINCT ref FROM entities WHERE kind IN ({', '.join('?' * len(kinds))}) ORDER BY ref", list(kinds))
+        else:
+            rows = self.connection.execute("SELECT DISTINCT ref FROM entities ORDER BY ref")
+        return [ref for ref, in rows]
+
+    def users_with_roles(self, minimum):
+        """(user, reachable roles) of the users that reach at least `minimum` roles."""
+        return self.connection.execute(
+            f"{USER_ROLES} SELECT user, COUNT(*) FROM user_roles GROUP BY user HAVING COUNT(*) >= ? ORDER BY user", (minimum,)
+        ).fetchall()
+
+    def leaf_groups(self, depth):
+        """Groups without children whose longest parent chain is `depth` long."""
+        rows = self.connection.execute(
+            f"{GROUP_DEPTHS} SELECT grp FROM group_depths WHERE depth = ? AND grp NOT IN (SELECT parent FROM parents) ORDER BY grp", (depth,)
+        )
+        return [group for group, in rows]
+
+    def cohorts(self, cohort):
+        """{cohort: sorted users} of the defined users.
+
+        - `roles` the number of roles a user reaches
+        - `depth` the depth of its deepest direct group
+        - `group` its first memberOf group
+        """
+        users = {user: None for user, in self.connection.execute("SELECT ref FROM entities WHERE kind = 'user'")}
+        if cohort == "roles":
+            users = dict.fromkeys(users, 0)
+            query = f"{USER_ROLES} SELECT user, COUNT(*) FROM user_roles GROUP BY user"
+        elif cohort == "depth":
+            query = f"{GROUP_DEPTHS} SELECT user, MAX(depth) FROM memberships JOIN group_depths ON group_depths.grp = memberships.group_ref GROUP BY user"
+        else:
+            query = "SELECT user, group_ref FROM memberships WHERE position = 0"
+        for user, value in self.connection.execute(query):
+            if user in users:
+                users[user] = value
+        result = {}
+        for user, value in sorted(users.items()):
+            result.setdefault(value, []).append(user)
+        # Users without a group or depth come last
+        return dict(sorted(result.items(), key=lambda item: (item[0] is None, item[0] if item[0] is not None else 0)))
+
+    def sample_users(self, k, cohort="roles", seed=None):
+        """Up to `k` users of every cohort, drawn reproducibly for a given seed."""
+        rng = random.Random(seed)
+        return {value: rng.sample(users, min(k, len(users))) for value, users in self.cohorts(cohort).items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Index an org and its RBAC policy in SQLite and query it.")
+    parser.add_argument("catalog", help="Top level Location file or folder of the org")
+    parser.add_argument("--policy", help="RBAC policy CSV (default: rbac-policy.csv next to the catalog, or in the current folder, if any)")
+    parser.add_argument("--database", help=f"SQLite file of the index (default: {DATABASE_NAME} next to the catalog)")
+    parser.add_argument("--users-with-roles", type=int, metavar="N", help="List the users that reach at least N roles")
+    parser.add_argument("--leaf-groups", type=int, metavar="DEPTH", help="List the leaf groups at this depth")
+    parser.add_argument("--sample", type=int, metavar="K", help="Sample K users of every cohort")
+    parser.add_argument("--cohort", choices=COHORTS, default="roles", help="What the sampled cohorts are made of (default: roles)")
+    parser.add_argument("-s", "--seed", type=int, default=None, help="Seed for reproducible samples")
+    parser.add_argument("--limit", type=int, default=20, help="Rows printed per query, 0 for all (default: 20)")
+    args = parser.parse_args()
+
+    folder = args.catalog if os.path.isdir(args.catalog) else os.path.dirname(args.catalog)
+    database = args.database or os.path.join(folder, DATABASE_NAME)
+    policy = args.policy or default_policy_file(args.catalog)
+    if args.policy and not os.path.exists(args.policy):
+        print(f"ERROR: policy file {args.policy} does not exist")
+        sys.exit(1)
+
+    start_time = time.perf_counter()
+    with GraphStore(database) as store:
+        stats = store.refresh(args.catalog, policy if os.path.exists(policy) else None)
+        print(f"- Refreshed {database} in {(time.perf_counter() - start_time) * 1000:.1f} ms: {', '.join(f'{name}: {count}' for name, count in sorted(stats.items()))}")
+        print(f"- Indexed: {', '.join(f'{name}: {count}' for name, count in store.counts().items())}")
+
+        limit = args.limit or None
+        if args.users_with_roles is not None:
+            users = store.users_with_roles(args.users_with_roles)
+            print(f"- Users with at least {args.users_with_roles} roles: {len(users)}")
+            for user, roles in users[:limit]:
+                print(f"  {user}: {roles}")
+        if args.leaf_groups is not None:
+            groups = store.leaf_groups(args.leaf_groups)
+            print(f"- Leaf groups at depth {args.leaf_groups}: {len(groups)}")
+            for group in groups[:limit]:
+                print(f"  {group}")
+        if args.sample is not None:
+            for value, users in store.sample_users(args.sample, args.cohort, args.seed).items():
+                print(f"- {args.cohort} {value}: {', '.join(users)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 import os
+import io
+import bisect
 import random
-import yaml
 import argparse
-import csv
+import multiprocessing
+from functools import partial
+
+from entity_writer import EntityWriter
+from shard_cache import ShardCache
+from serializers import SERIALIZERS, get_serializer
+from output_packing import entities_per_file, plan_locations, write_location_tree
+from policy_model import PolicyModel, add_policy_arguments
+from membership import MembershipModel, add_membership_arguments
 
 FRUITS = [
   "apple", "apricot",
@@ -46,13 +55,13 @@ GROUP_FOLDER_STRUCTURE = "catalog-entities/extreme-org/groups"
 USER_FOLDER_STRUCTURE = "catalog-entities/extreme-org/users"
 LOCATION_FOLDER_STRUCTURE = "catalog-entities/extreme-org/"
 BASE_USER_FOLDER_STRUCTURE = "catalog-entities/extreme-org/"
+CACHE_FOLDER_STRUCTURE = "catalog-entities/extreme-org/.cache"
 
 GROUP_CHOICES = []
 USER_CHOICES = []
 LOCATIONS = ["users", "groups"]
 LOCATIONS_CHOICES = [USER_CHOICES, GROUP_CHOICES]
 
-global NODE_COUNTER
 
 GUARANTEED_PERMISSION = [
   [" catalog-entity", " read", " allow"],
@@ -74,13 +83,44 @@ PERMISSIONS = [
   [" scaffolder.template.step.read", " read", " deny"],
 ]
 
+# Every role gets one permission drawn from each of these ranges of PERMISSIONS
+PERMISSION_RANGES = [(0, 3), (4, 7), (8, 11)]
+POLICY_BATCH_SIZE = 65536
+MAX_SOLVER_BRANCHING = 16
+DEFAULT_SOLVER_TOLERANCE = 0.1
+
+def build_role_templates():
+    """Policy rows of a role for each possible 7 bit draw.
+
+    The lowest bit picks the guaranteed permission and each following pair of
+    bits picks one permission of a range, so a single random byte per role
+    selects all of its rows. The role name is filled in with `str.format`.
+    """
+    templates = []
+    for bits in range(128):
+        rows = ["g, group:default/{0}, role:default/{0}"]
+        rows.append("p, role:default/{0}," + ",".join(GUARANTEED_PERMISSION[bits & 1]))
+        for index, (start, end) in enumerate(PERMISSION_RANGES):
+            rows.append("p, role:default/{0}," + ",".join(PERMISSIONS[start + ((bits >> (1 + 2 * index)) & 3)]))
+        # csv.writer line endings, followed by the empty row between roles
+        templates.append("\r\n".join(rows) + "\r\n\r\n")
+    return templates
+
+ROLE_TEMPLATES = build_role_templates()
+
 NUM_OF_USERS = 0
 NUM_OF_GROUPS = 0
 NUM_OF_ROLES = 0
 NUM_OF_PERMISSIONS = 0
 
+ENTITY_WRITER = None
+SERIALIZER = get_serializer()
+USERS_PER_FILE = 0
+GROUPS_PER_FILE = 0
+
 def generate_user_yaml_content(name, number, group, group_number):
-  memberOf = group
+  # A single group name, or the list of every group the user is a member of
+  memberOf = group if isinstance(group, list) else [group]
   if number > -1:
     username = f"{name.lower()}_{number}_{group_number}"
     email = f"{name.lower()}_{number}_{group_number}@example.com"
@@ -89,150 +129,332 @@ def generate_user_yaml_content(name, number, group, group_number):
     username = name
     email = f"{name}@example.com"
     displayName = f"{name}"
-  content = {
-    "apiVersion": "backstage.io/v1alpha1",
-    "kind": "User",
-    "metadata": {
-        "name": username
-    },
-    "spec": {
-        "profile": {
-          "email": email,
-          "displayName": displayName,
-        },
-        "memberOf": [memberOf]
-    }
-  }
-  return yaml.dump(content)
+  return SERIALIZER.user(username, email, displayName, memberOf)
 
 def generate_group_yaml_content(name, number, parent_group=None):
   groupName = f"{name.lower()}_{number}"
   title = f"{name.capitalize()} {number}"
-  content = {
-    "apiVersion": "backstage.io/v1alpha1",
-    "kind": "Group",
-    "metadata": {
-      "name": groupName,
-      "title": title,
-    },
-    "spec": {
-      "type": "team",
-      "children": []
-    }
-  }
-  if parent_group:
-    content["spec"]["parent"] = parent_group.lower()
-  return yaml.dump(content)
+  return SERIALIZER.group(groupName, title, parent_group.lower() if parent_group else None)
 
 def generate_location_yaml_content(name, children):
     folder = f"/{name}/"
     ex = ".local.yaml"
     for i in range(len(children)):
       children[i] = f"./{children[i]}{ex}"
-    content = {
-        "apiVersion": "backstage.io/v1alpha1",
-        "kind": "Location",
-        "metadata": {
-            "name": f"{name.lower()}",
-            "description": f"A collection of all {name.lower()}"
-        },
-        "spec": {
-            "targets": children
-        }
-    }
-    return yaml.dump(content)
-
-class Node:
-    def __init__(self, name, value, node_id):
-        self.name = name
-        self.value = value
-        self.left = None
-        self.right = None
-        self.id = node_id
-
-def create_balanced_binary_tree(root_choice, root_value, root_group_name, height, users, node_counter, hierarchy_counter):
+    return SERIALIZER.location(name, children)
+
+def tree_size(branching, height):
+    """Number of groups in a perfect `branching`-ary tree with `height` levels."""
+    return sum(branching ** level for level in range(height))
+
+class BalancedTree:
+    """A perfect k-ary tree stored in arrays indexed by heap position.
+
+    Position 1 is the root and the children of position i are k(i - 1) + 2 to
+    ki + 1, so a node's parent, level and group number follow from its
+    position. `level_starts` holds the first position of every level. The only
+    per-node state is the index of the vegetable used in the group name.
+    """
+    def __init__(self, height, hierarchy_counter, branching=2):
+        self.height = height
+        self.branching = branching
+        self.hierarchy_counter = hierarchy_counter
+        self.level_starts = [tree_size(branching, level) + 1 for level in range(height + 1)]
+        self.leaf_start = self.level_starts[height - 1]
+        self.vegetables = bytearray(self.level_starts[height])
+
+    def name(self, position):
+        return f"{VEGETABLES[self.vegetables[position]]}_{position + self.hierarchy_counter}"
+
+    def parent(self, position):
+        return (position - 2) // self.branching + 1
+
+    def level(self, position):
+        """Level of a position, the root being level 1."""
+        return bisect.bisect_right(self.level_starts, position)
+
+    def level_range(self, level):
+        """Positions of every node on `level` (the root is level 1), left to right."""
+        if level < 1 or level > self.height:
+            return range(0)
+        return range(self.level_starts[level - 1], self.level_starts[level])
+
+    def preorder(self):
+        """Walk the positions depth first, visiting the children left to right."""
+        position = 1
+        while True:
+            yield position
+            if position < self.leaf_start:
+                position = self.branching * (position - 1) + 2
+                continue
+            # Climb out of every subtree we are the last child of
+            while (position - 1) % self.branching == 0:
+                if position == 1:
+                    return
+                position = self.parent(position)
+            position += 1
+
+def create_balanced_tree(tree, root_group_name, users, membership=None):
+    """Write the groups of a root in preorder, and the users of every leaf group.
+
+    Without a membership model every leaf gets `users` users, each a member of
+    that leaf only. With one, the root's `users` per leaf are spread over its
+    leaves by the model, and users can also be members of other leaves.
+    """
     global NUM_OF_USERS
     global NUM_OF_GROUPS
-    # We will use root number for the users
-    name = f"{root_choice.lower()}_{node_counter + hierarchy_counter}"
-    if height == 0:
-        for user_number in range(users):
-            user_choice = random.choice(FRUITS)
-            user_content = generate_user_yaml_content(user_choice, user_number, name, node_counter + hierarchy_counter)
-            NUM_OF_USERS += 1
-            save_user_yaml_file_for_group(name, user_content, USER_FOLDER_STRUCTURE)
-        USER_CHOICES.append(name)
-        return None
-    root = Node(name, root_value, node_counter + hierarchy_counter)
-
-    # Left
-    left_node_number = node_counter * 2
-    left_choice = f"{random.choice(VEGETABLES)}"
-    left_content = generate_group_yaml_content(left_choice, left_node_number + hierarchy_counter, root.name)
-    NUM_OF_GROUPS += 1
-    save_yaml_file_for_group(root_group_name, left_content, GROUP_FOLDER_STRUCTURE)
-    if height - 1 == 0:
-        left_name = f"{left_choice.lower()}_{left_node_number + hierarchy_counter}"
-        root.left = Node(left_name, left_content, left_node_number + hierarchy_counter)
-        create_balanced_binary_tree(left_choice, left_content, root_group_name, height - 1, users, left_node_number, hierarchy_counter)
-    else:
-        root.left = create_balanced_binary_tree(left_choice, left_content, root_group_name, height - 1, users, left_node_number, hierarchy_counter)
-
-    # Right
-    right_node_number = node_counter * 2 + 1
-    right_choice = f"{random.choice(VEGETABLES)}"
-    right_content = generate_group_yaml_content(right_choice, right_node_number + hierarchy_counter, root.name)
-    NUM_OF_GROUPS += 1
-    save_yaml_file_for_group(root_group_name, right_content, GROUP_FOLDER_STRUCTURE)
-    if height - 1 == 0:
-        right_name = f"{right_choice.lower()}_{right_node_number + hierarchy_counter}"
-        root.right = Node(right_name, right_content, right_node_number + hierarchy_counter)
-        create_balanced_binary_tree(right_choice, right_content, root_group_name, height - 1, users, right_node_number, hierarchy_counter)
-    else:
-        root.right = create_balanced_binary_tree(right_choice, right_content, root_group_name, height - 1, users, right_node_number, hierarchy_counter)
-    return root
-
-def print_tree(root, level=0, file=None):
-    if root is not None:
-        line = "| " * level + "|- group:default/" + str(root.name)
-        print(line)
+    leaves = tree.level_range(tree.height)
+    if membership is not None:
+        # Users may name any leaf, so every group is named before the walk
+        for position in tree.preorder():
+            if position > 1:
+                tree.vegetables[position] = random.randrange(len(VEGETABLES))
+        sizes = membership.group_sizes(len(leaves), users * len(leaves))
+        primaries = [leaf for leaf, size in enumerate(sizes) for _ in range(size)]
+        member_lists = iter(membership.memberships(primaries, len(leaves)))
+    for position in tree.preorder():
+        if position > 1:
+            if membership is None:
+                tree.vegetables[position] = random.randrange(len(VEGETABLES))
+            group_content = generate_group_yaml_content(VEGETABLES[tree.vegetables[position]], position + tree.hierarchy_counter, tree.name(tree.parent(position)))
+            NUM_OF_GROUPS += 1
+            save_yaml_file_for_group(root_group_name, group_content, GROUP_FOLDER_STRUCTURE)
+        if position >= tree.leaf_start:
+            # We will use the group number for the users
+            name = tree.name(position)
+            leaf_users = users if membership is None else sizes[position - leaves.start]
+            for user_number in range(leaf_users):
+                user_choice = random.choice(FRUITS)
+                member_of = name if membership is None else [tree.name(leaves[leaf]) for leaf in next(member_lists)]
+                user_content = generate_user_yaml_content(user_choice, user_number, member_of, position + tree.hierarchy_counter)
+                NUM_OF_USERS += 1
+                if USERS_PER_FILE:
+                    record_file(USER_CHOICES, ENTITY_WRITER.write_packed(USER_FOLDER_STRUCTURE, f"{root_group_name}-users", user_content, USERS_PER_FILE))
+                else:
+                    save_user_yaml_file_for_group(name, user_content, USER_FOLDER_STRUCTURE)
+            if not USERS_PER_FILE and leaf_users:
+                USER_CHOICES.append(name)
+    return tree
+
+def print_tree(tree, file=None):
+    for position in tree.preorder():
+        line = "| " * (tree.level(position) - 1) + "|- group:default/" + tree.name(position)
         file.write(line + "\n")
-        print_tree(root.left, level + 1, file)
-        print_tree(root.right, level + 1, file)
-
-def draw_hierarchy_tree(root):
-  with open("catalog-entities/extreme-org/hierarchy_tree.txt", "a") as file:
-    if root is not None:
-      print_tree(root, 0, file)
-      line = "---------------------------"
-      print(line)
-      file.write(line + "\n")
 
-def create_content(args):
+def draw_hierarchy_tree(tree, file):
+  print_tree(tree, file)
+  file.write("---------------------------\n")
+
+def entities_per_files(args):
+    """Users and groups packed into each file, which depend on the whole org when `--files` is set."""
+    users = args.entities_per_file or entities_per_file(args.root * args.branching ** (args.hierarchy - 1) * args.users, args.files)
+    groups = args.entities_per_file or entities_per_file(args.root * tree_size(args.branching, args.hierarchy), args.files)
+    return users, groups
+
+def shard_keys(args, root_number):
+    """Cache keys of a root's entity files and of its policy rows."""
+    membership_options = [args.group_sizes, args.memberships, args.memberships_per_user, args.zipf_exponent]
+    # The effective chunking, not --files, so a different -r with the same --files is a miss
+    entity_key = ShardCache.key("entities", args.seed, root_number, args.branching, args.hierarchy, args.users, membership_options, args.serializer, entities_per_files(args))
+    policy_options = [args.roles_per_group, args.permissions_per_role, args.role_inheritance, args.allow_ratio, args.role_fraction]
+    policy_key = ShardCache.key("policy", args.seed, root_number, args.branching, args.hierarchy, args.users, args.level, policy_options)
+    return entity_key, policy_key
+
+def generate_root(args, task):
+    """Generate the subtree of a single root group.
+
+    Group and user files are written directly since no two roots share a file.
+    The hierarchy text and policy rows are returned together with the stats
+    and file lists so the caller can merge every root in order. `task` tells
+    which parts of the shard can be rebuilt from the cache instead.
+    """
+    global NUM_OF_USERS
     global NUM_OF_GROUPS
-    for root_number in range(args.root):
-        if root_number == 0:
-            number = 0
-        else:
-            number = (2 ** (args.hierarchy) - 1) * root_number
-        
-        NODE_COUNTER = 1
-        root_choice = random.choice(VEGETABLES)
-        root_content = generate_group_yaml_content(root_choice, number + NODE_COUNTER)
+    global NUM_OF_ROLES
+    global NUM_OF_PERMISSIONS
+    global ENTITY_WRITER
+    global SERIALIZER
+    global USERS_PER_FILE
+    global GROUPS_PER_FILE
+    root_number, entities_cached, policy_cached = task
+    SERIALIZER = get_serializer(args.serializer)
+    USERS_PER_FILE, GROUPS_PER_FILE = entities_per_files(args)
+    NUM_OF_USERS = NUM_OF_GROUPS = NUM_OF_ROLES = NUM_OF_PERMISSIONS = 0
+    del USER_CHOICES[:]
+    del GROUP_CHOICES[:]
+    ENTITY_WRITER = EntityWriter(mode="w")
+    cache = ShardCache(CACHE_FOLDER_STRUCTURE, load_manifest=False)
+    entity_key, policy_key = shard_keys(args, root_number)
+
+    # Every root owns a contiguous block of group numbers
+    number = tree_size(args.branching, args.hierarchy) * root_number
+
+    tree = BalancedTree(args.hierarchy, number, args.branching)
+    if entities_cached:
+        tree.vegetables[:] = cache.read_blob(entity_key, ".tree")
+    else:
+        if args.seed is not None:
+            random.seed(f"{args.seed}:{root_number}")
+        tree.vegetables[1] = random.randrange(len(VEGETABLES))
+        root_content = generate_group_yaml_content(VEGETABLES[tree.vegetables[1]], number + 1)
         NUM_OF_GROUPS += 1
-        root_group_name = f"{root_choice.lower()}_{number + NODE_COUNTER}"
+        root_group_name = tree.name(1)
         save_yaml_file_for_group(root_group_name, root_content, GROUP_FOLDER_STRUCTURE)
-        GROUP_CHOICES.append(root_group_name)
 
-        # Create the balanced binary tree for this root
-        tree_root = create_balanced_binary_tree(root_choice, root_content, root_group_name, args.hierarchy - 1, args.users, NODE_COUNTER, number)
-        draw_hierarchy_tree(tree_root)
+        # Create the balanced tree for this root
+        create_balanced_tree(tree, root_group_name, args.users, MembershipModel.from_args(args))
+    ENTITY_WRITER.close()
 
-        write_to_csv(tree_root, args.level)
-    
-    for i in range(len(LOCATIONS)):
-        location_yaml_content = generate_location_yaml_content(LOCATIONS[i], LOCATIONS_CHOICES[i])
-        save_location_yaml_file(LOCATIONS[i], location_yaml_content, 1, f"{LOCATION_FOLDER_STRUCTURE}/{LOCATIONS[i]}")
+    tree_file = io.StringIO()
+    draw_hierarchy_tree(tree, tree_file)
+    if policy_cached:
+        policy = cache.read_blob(policy_key, ".csv", "r")
+    else:
+        if args.seed is not None:
+            random.seed(f"{args.seed}:{root_number}:policy")
+        csv_file = io.StringIO()
+        policy_model = PolicyModel.from_args(args)
+        if policy_model is not None:
+            policy_model.write(csv_file, (tree.name(position) for position in tree.level_range(args.level)))
+            NUM_OF_ROLES = policy_model.roles
+            NUM_OF_PERMISSIONS = policy_model.permissions
+        else:
+            write_to_csv(tree, args.level, csv_file)
+        policy = csv_file.getvalue()
+
+    return {
+        "root": root_number,
+        "entity_key": entity_key,
+        "policy_key": policy_key,
+        "entities_cached": entities_cached,
+        "policy_cached": policy_cached,
+        "vegetables": None if entities_cached else bytes(tree.vegetables),
+        "groups": NUM_OF_GROUPS,
+        "users": NUM_OF_USERS,
+        "roles": NUM_OF_ROLES,
+        "permissions": NUM_OF_PERMISSIONS,
+        "entities": ENTITY_WRITER.entities,
+        "group_files": list(GROUP_CHOICES),
+        "user_files": list(USER_CHOICES),
+        "tree": tree_file.getvalue(),
+        "policy": policy,
+    }
+
+def plan_shards(args, cache):
+    """Decide per root whether its entities and policy can be reused from the cache.
+
+    Shards that are stale, or belong to roots beyond `--root`, have their files
+    removed before anything is generated so they never clobber fresh output.
+    """
+    if args.seed is None:
+        # Unseeded output can not be reproduced, so nothing on disk is reusable
+        cache.clear()
+        return [(root_number, False, False) for root_number in range(args.root)]
+
+    keys = {root_number: shard_keys(args, root_number) for root_number in range(args.root)}
+    for root_number in cache.entries("entities"):
+        if root_number not in keys or cache.lookup("entities", root_number, keys[root_number][0], ".tree") is None:
+            cache.discard("entities", root_number)
+    for root_number in cache.entries("policy"):
+        if root_number not in keys:
+            cache.discard("policy", root_number)
+
+    tasks = []
+    for root_number, (entity_key, policy_key) in keys.items():
+        entities_cached = cache.lookup("entities", root_number, entity_key, ".tree") is not None
+        policy_cached = entities_cached and cache.lookup("policy", root_number, policy_key, ".csv") is not None
+        tasks.append((root_number, entities_cached, policy_cached))
+    return tasks
+
+def update_cache(cache, result):
+    """Record a freshly generated shard so the next run can reuse it."""
+    root_number = result["root"]
+    if not result["entities_cached"]:
+        cache.write_blob(result["entity_key"], ".tree", result["vegetables"])
+        files = [f"{GROUP_FOLDER_STRUCTURE}/{name}.local.yaml" for name in result["group_files"]]
+        files += [f"{USER_FOLDER_STRUCTURE}/{name}.local.yaml" for name in result["user_files"]]
+        cache.store("entities", root_number, {
+            "key": result["entity_key"],
+            "groups": result["groups"],
+            "users": result["users"],
+            "group_files": result["group_files"],
+            "user_files": result["user_files"],
+            "files": files,
+        })
+    if not result["policy_cached"]:
+        cache.write_blob(result["policy_key"], ".csv", result["policy"])
+        cache.store("policy", root_number, {
+            "key": result["policy_key"],
+            "roles": result["roles"],
+            "permissions": result["permissions"],
+        })
+
+def create_content(args):
+    global NUM_OF_USERS
+    global NUM_OF_GROUPS
+    global NUM_OF_ROLES
+    global NUM_OF_PERMISSIONS
+    global SERIALIZER
+    SERIALIZER = get_serializer(args.serializer)
+    cache = ShardCache(CACHE_FOLDER_STRUCTURE)
+    tasks = plan_shards(args, cache)
+    writer = EntityWriter(mode="w")
+    tree_file = writer.handle("catalog-entities/extreme-org/hierarchy_tree.txt")
+    csv_file = writer.handle("catalog-entities/extreme-org/rbac-policy.csv", newline='')
+    totals = {"groups": 0, "users": 0, "roles": 0, "permissions": 0}
+    group_files = []
+    user_files = []
+
+    if args.workers > 1:
+        # Every worker reseeds so forked processes do not share a random state
+        pool = multiprocessing.Pool(args.workers, initializer=random.seed)
+        results = pool.imap(partial(generate_root, args), tasks)
+    else:
+        pool = None
+        results = map(partial(generate_root, args), tasks)
+
+    # Results arrive in root order whatever the number of workers
+    for result in results:
+        if args.seed is not None:
+            update_cache(cache, result)
+        if result["entities_cached"]:
+            entry = cache.entries("entities")[result["root"]]
+            result.update(groups=entry["groups"], users=entry["users"], group_files=entry["group_files"], user_files=entry["user_files"])
+        if result["policy_cached"]:
+            entry = cache.entries("policy")[result["root"]]
+            result.update(roles=entry["roles"], permissions=entry["permissions"])
+        print(result["tree"], end="")
+        tree_file.write(result["tree"])
+        csv_file.write(result["policy"])
+        for key in totals:
+            totals[key] += result[key]
+        writer.entities += result["entities"]
+        group_files.extend(result["group_files"])
+        user_files.extend(result["user_files"])
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    writer.close()
+    if args.seed is not None:
+        cache.save()
+        cache.prune()
+
+    NUM_OF_GROUPS = totals["groups"]
+    NUM_OF_USERS = totals["users"]
+    NUM_OF_ROLES = totals["roles"]
+    NUM_OF_PERMISSIONS = totals["permissions"]
+    GROUP_CHOICES[:] = group_files
+    USER_CHOICES[:] = user_files
+
+    with EntityWriter(mode="w") as location_writer:
+        for i in range(len(LOCATIONS)):
+            folder = f"{LOCATION_FOLDER_STRUCTURE}/{LOCATIONS[i]}"
+            targets, intermediates = plan_locations(LOCATIONS[i], LOCATIONS_CHOICES[i], args.location_fanout)
+            write_location_tree(SERIALIZER, location_writer, folder, intermediates)
+            LOCATIONS_CHOICES[i][:] = targets
+            location_yaml_content = generate_location_yaml_content(LOCATIONS[i], LOCATIONS_CHOICES[i])
+            save_location_yaml_file(LOCATIONS[i], location_yaml_content, 1, folder)
 
     all_location_target = ['base-user', 'groups/groups', 'users/users']
     location_yaml_content = generate_location_yaml_content('entities', all_location_target)
@@ -242,19 +464,23 @@ def create_content(args):
     base_user_yaml_content = generate_user_yaml_content('<YOUR_USER_NAME>', -1, '<YOUR_GROUP>', -1)
     save_location_yaml_file('base-user', base_user_yaml_content, 1, f"{LOCATION_FOLDER_STRUCTURE}")
 
+    return writer
+
+def record_file(choices, name):
+    if not choices or choices[-1] != name:
+        choices.append(name)
+
 def save_yaml_file_for_group(parent_group_name, content, folder_structure):
-    filename = f"{folder_structure}/{parent_group_name}.local.yaml"
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, "a") as file:
-        file.write(content)
-        file.write("---\n")
+    if GROUPS_PER_FILE:
+        name = ENTITY_WRITER.write_packed(folder_structure, parent_group_name, content, GROUPS_PER_FILE)
+    else:
+        name = parent_group_name
+        ENTITY_WRITER.write_entity(f"{folder_structure}/{name}.local.yaml", content)
+    record_file(GROUP_CHOICES, name)
 
 def save_user_yaml_file_for_group(group_name, content, folder_structure):
     filename = f"{folder_structure}/{group_name}.local.yaml"
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, "a") as file:
-        file.write(content)
-        file.write("---\n")
+    ENTITY_WRITER.write_entity(filename, content)
 
 def save_location_yaml_file(name, content, number, folder_structure):
     filename = f"{folder_structure}/{name.lower()}.local.yaml"
@@ -262,49 +488,123 @@ def save_location_yaml_file(name, content, number, folder_structure):
     with open(filename, "w") as file:
         file.write(content)
 
-def write_to_csv(root, level):
-    with open("catalog-entities/extreme-org/rbac-policy.csv", mode="a", newline='') as file:
-        writer = csv.writer(file)
-        write_tree_to_csv(root, writer, 1, level)
+def write_to_csv(tree, level, file):
+    """Stream the policy of every group on `level` straight from its heap positions.
 
-def write_tree_to_csv(root, writer, current_level, level):
+    The permissions of a whole batch of roles are drawn with one `getrandbits`
+    call and the rows are written a batch at a time.
+    """
     global NUM_OF_ROLES
     global NUM_OF_PERMISSIONS
-    if root is not None:
-        if current_level == level:
-            # Write the current node to CSV
-            writer.writerow(["g", " group:default/" + root.name, " role:default/" + root.name])
-            NUM_OF_ROLES += 1
-            aOd = random.randint(0,1)
-            writer.writerow(["p", " role:default/" + root.name, *GUARANTEED_PERMISSION[aOd]])
-            NUM_OF_PERMISSIONS += 1
-            
-            ranges = [(0, 3), (4, 7), (8, 11)]
-
-            for start, end in ranges:
-                random_permission = random.randint(start, end)
-                writer.writerow(["p", " role:default/" + root.name, *PERMISSIONS[random_permission]])
-                NUM_OF_PERMISSIONS += 1
-            writer.writerow([])
-        # Recursively traverse left and right subtrees
-        write_tree_to_csv(root.left, writer, current_level + 1, level)
-        write_tree_to_csv(root.right, writer, current_level + 1, level)
+    positions = tree.level_range(level)
+    for batch_start in range(0, len(positions), POLICY_BATCH_SIZE):
+        batch = positions[batch_start:batch_start + POLICY_BATCH_SIZE]
+        draws = random.getrandbits(8 * len(batch)).to_bytes(len(batch), "little")
+        file.write("".join(ROLE_TEMPLATES[bits & 0x7f].format(tree.name(position)) for position, bits in zip(batch, draws)))
+        NUM_OF_ROLES += len(batch)
+        NUM_OF_PERMISSIONS += len(batch) * (1 + len(PERMISSION_RANGES))
+
+def shape_counts(args):
+    """Groups, users and (expected) roles the given shape generates."""
+    leaves = args.root * args.branching ** (args.hierarchy - 1)
+    level_groups = args.root * args.branching ** (args.level - 1) if 1 <= args.level <= args.hierarchy else 0
+    roles_per_group = (args.roles_per_group or 1) * (1.0 if args.role_fraction is None else args.role_fraction)
+    return {
+        "groups": args.root * tree_size(args.branching, args.hierarchy),
+        "users": leaves * args.users,
+        "roles": round(level_groups * roles_per_group),
+    }
+
+def solve_shape(args, targets, tolerance=DEFAULT_SOLVER_TOLERANCE):
+    """Pick the roots, branching factor, height, users per leaf and role level closest to `targets`.
+
+    Every branching factor (or only `--branching` when given) and height is
+    tried, with the number of roots, users per leaf and role level that best
+    fit it. Among the shapes whose worst relative error is within `tolerance`
+    the one with the fewest roots, then the smallest branching factor, wins so
+    the trees stay deep. When none is close enough the tolerance is doubled,
+    until it covers the worst candidate.
+    """
+    if tolerance <= 0 or any(target <= 0 for target in targets.values()):
+        raise SystemExit("ERROR: the targets and the tolerance of the solver must be positive")
+    branchings = [args.branching] if args.branching else range(2, MAX_SOLVER_BRANCHING + 1)
+    candidates = []
+    for branching in branchings:
+        height = 1
+        while tree_size(branching, height) <= 2 * targets["groups"]:
+            shape = argparse.Namespace(**vars(args))
+            shape.branching = branching
+            shape.hierarchy = height
+            shape.root = max(1, round(targets["groups"] / tree_size(branching, height)))
+            if "users" in targets:
+                shape.users = max(1, round(targets["users"] / (shape.root * branching ** (height - 1))))
+            levels = range(1, height + 1) if "roles" in targets else [min(max(args.level, 1), height)]
+            for level in levels:
+                shape.level = level
+                counts = shape_counts(shape)
+                error = max(abs(counts[name] - target) / target for name, target in targets.items())
+                candidates.append((error, argparse.Namespace(**vars(shape))))
+            height += 1
+    if not candidates:
+        raise SystemExit(f"ERROR: no shape can be solved for {targets}")
+    largest_error = max(error for error, _ in candidates)
+    while True:
+        close = [candidate for candidate in candidates if candidate[0] <= tolerance]
+        if close:
+            return min(close, key=lambda candidate: (candidate[1].root, candidate[1].branching, candidate[0]))[1]
+        if tolerance > largest_error:
+            raise SystemExit(f"ERROR: no shape is within {tolerance:g} of {targets}")
+        tolerance *= 2
 
 def main():
   parser = argparse.ArgumentParser(description="Your script description")
   parser.add_argument("-r", "--root", type=int, default=2, help="Number of Root Groups")
   parser.add_argument("-g", "--hierarchy", type=int, default=3, help="Hierarchy level for your true")
+  parser.add_argument("-b", "--branching", type=int, default=None, help="Number of children of every group (default: 2)")
   parser.add_argument("-u", "--users", type=int, default=2, help="Number of users at the base of the tree")
   parser.add_argument("-l", "--level", type=int, default=3, help="Start writing roles from this hierarchy level")
+  parser.add_argument("-w", "--workers", type=int, default=1, help="Number of processes generating root groups in parallel")
+  parser.add_argument("--serializer", choices=sorted(SERIALIZERS), default="yaml", help="Backend used to serialize the catalog entities")
+  parser.add_argument("--entities-per-file", type=int, default=0, help="Pack this many users or groups into each file instead of one file per group")
+  parser.add_argument("--files", type=int, default=0, help="Spread the users and the groups over about this many files each")
+  parser.add_argument("--location-fanout", type=int, default=0, help="Maximum number of targets per Location, larger lists become nested Locations")
+  add_policy_arguments(parser)
+  add_membership_arguments(parser)
+  parser.add_argument("-s", "--seed", type=int, default=None, help="Seed for reproducible output, enables reusing unchanged root groups from the previous run")
+  parser.add_argument("--target-groups", type=int, help="Solve -r/-b/-g (and -u/-l with the other targets) for about this many groups")
+  parser.add_argument("--target-users", type=int, help="Number of users to solve -u for, requires --target-groups")
+  parser.add_argument("--target-roles", type=int, help="Number of roles to solve -l for, requires --target-groups")
+  parser.add_argument("--tolerance", type=float, default=DEFAULT_SOLVER_TOLERANCE, help=f"Relative error to the targets the solver accepts before adding roots (default: {DEFAULT_SOLVER_TOLERANCE})")
+  parser.add_argument("--dry-run", action="store_true", help="Only print the shape and the counts it would generate")
 
   args = parser.parse_args()
-
-  root = create_content(args)
+  targets = {name: value for name, value in (("groups", args.target_groups), ("users", args.target_users), ("roles", args.target_roles)) if value is not None}
+  if any(value <= 0 for value in targets.values()):
+    parser.error("--target-groups, --target-users and --target-roles must be positive")
+  if args.tolerance <= 0:
+    parser.error("--tolerance must be positive")
+  if targets:
+    if "groups" not in targets:
+      parser.error("--target-users and --target-roles require --target-groups")
+    args = solve_shape(args, targets, args.tolerance)
+  if args.branching is None:
+    args.branching = 2
+  if args.branching < 2:
+    parser.error("--branching must be at least 2")
+  if targets or args.dry_run:
+    counts = shape_counts(args)
+    print(f"- Shape: -r {args.root} -b {args.branching} -g {args.hierarchy} -u {args.users} -l {args.level}")
+    print(f"- Expected groups: {counts['groups']}, users: {counts['users']}, roles: {counts['roles']}")
+    if args.dry_run:
+      return
+
+  writer = create_content(args)
 
   print(f"- The number of groups: {NUM_OF_GROUPS}")
   print(f"- The number of users: {NUM_OF_USERS}")
   print(f"- The number of roles: {NUM_OF_ROLES}")
   print(f"- The number of permissions: {NUM_OF_PERMISSIONS}")
+  print(f"- Entities written per second: {writer.entities_per_second():.0f}")
 
 if __name__ == "__main__":
   main()
@@ -28,6 +28,11 @@ import aiohttp # type: ignore
 import time
 import argparse
 import sys
+import os
+
+# The shared latency histograms live in the folder above
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from latency_histogram import LatencyRecorder, format_summary
 
 BASE_URL = "<base backstage url>"
 DEFAULT_NUM_REQUESTS = 1000
@@ -42,6 +47,7 @@ ssl_context.verify_mode = ssl.CERT_NONE
 
 successful_read_requests = 0
 counter_lock = asyncio.Lock()
+latency_recorder = LatencyRecorder()
 
 async def createPermission(permission, session):
     print(f"Create permission: {permission}")
@@ -159,6 +165,7 @@ async def getRole(role, iteration, session):
                 print(f"Response body: {responseBody}")
                 async with counter_lock:
                     successful_read_requests += 1
+                latency_recorder.record("roles", end_time - start_time)
                 return end_time - start_time
             else:
                 print(f"Failed to get role {role}. Status code is: {response.status}.")
@@ -167,7 +174,7 @@ async def getRole(role, iteration, session):
         print(f"Request timed out while getting role: {role}")
         return 0
 
-async def main(reuse_session, num_requests):
+async def main(reuse_session, num_requests, output=None):
     role = "role:default/test-role"
     roleMembers = '[ "user:default/test-user"]'
     roleRaw = '{ "memberReferences":  ' + roleMembers + ', "name": "' + role + '" }'
@@ -220,7 +227,10 @@ async def main(reuse_session, num_requests):
             print(f"Average time per request across iterations: {average_time_per_request:.3f} seconds")
             print(f"Average iteration time: {average_iteration_time:.3f} seconds")
             print(f"Total time for all iterations: {total_time:.3f} seconds")
+            print(f"Latency of successful requests: {format_summary(latency_recorder.histogram('roles').summary())}")
             print("=" * 80)
+        if output:
+            latency_recorder.write_json(output)
     finally:
         if reuse_session and shared_session:
             await shared_session.close()
@@ -229,6 +239,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run the read consistency checker.")
     parser.add_argument("--reuse-session", action="store_true", help="Reuse a single session for all requests")
     parser.add_argument("--num-requests", type=int, default=DEFAULT_NUM_REQUESTS, help="Number of requests to send in each iteration (default: 900)")
+    parser.add_argument("--output", help="Write the latency histogram as JSON to this file")
     args = parser.parse_args()
 
-    asyncio.run(main(args.reuse_session, args.num_requests))
+    asyncio.run(main(args.reuse_session, args.num_requests, args.output))
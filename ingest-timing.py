@@ -0,0 +1,179 @@
+# This script measures how fast the catalog ingests a generated org, so different
+# output packings (see --entities-per-file, --files and --location-fanout in
+# tree.py and hierarchy.py) can be compared on file count versus file size.
+#
+# For every Location file given on the command line it registers the Location
+# through the Catalog API, polls until every User and Group in it is visible,
+# reports the ingestion throughput and unregisters the Location again.
+#
+# Prerequisites:
+# The catalog must be allowed to read the generated files, e.g. in app-config:
+# catalog:
+#   rules:
+#     - allow: [User, Group, Location]
+#   reading:
+#     allow:
+#       - host: localhost
+# and `catalog.orphanStrategy: delete` so unregistered entities are removed.
+#
+# Example of how to run the script:
+# export token=your-token
+# python ingest-timing.py catalog-entities/packed-10/all.local.yaml catalog-entities/packed-1000/all.local.yaml
+import asyncio
+import aiohttp
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from catalog_loader import iter_catalog
+
+BASE_URL = "http://localhost:7007"
+AUTH_TOKEN = os.environ.get('token')
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_TIMEOUT = 3600
+# Names the catalog accepts, anything else (like the <YOUR_USER_NAME> placeholder
+# of base-user.local.yaml) is rejected and never shows up in the counts
+ENTITY_NAME = re.compile(r"[A-Za-z0-9]+(?:[-_.][A-Za-z0-9]+)*")
+MAX_NAME_LENGTH = 63
+
+def describe_location(location_file):
+    """Walk a Location tree on disk and count its files, bytes, Users and Groups.
+
+    Users and Groups whose name the catalog rejects are counted as `invalid`
+    instead, since they are never ingested.
+    """
+    stats = {"files": 0, "bytes": 0, "users": 0, "groups": 0, "locations": 0, "invalid": 0}
+    seen = set()
+    for catalog_file, document in iter_catalog(location_file):
+        if catalog_file not in seen:
+            seen.add(catalog_file)
+            stats["files"] += 1
+            stats["bytes"] += os.path.getsize(catalog_file)
+        kind = document.get("kind")
+        name = str((document.get("metadata") or {}).get("name") or "")
+        if kind in ("User", "Group") and not (len(name) <= MAX_NAME_LENGTH and ENTITY_NAME.fullmatch(name)):
+            stats["invalid"] += 1
+        elif kind == "User":
+            stats["users"] += 1
+        elif kind == "Group":
+            stats["groups"] += 1
+        elif kind == "Location":
+            stats["locations"] += 1
+    return stats
+
+def headers():
+    return {
+        "Authorization": f"Bearer {AUTH_TOKEN}",
+        "Content-Type": "application/json"
+    }
+
+def check_response(response, expected_status):
+    if response.status == 401:
+        print("ERROR: Update token!")
+        sys.exit(1)
+    if response.status != expected_status:
+        print(f"Unexpected error. Status code is {response.status}.")
+        sys.exit(1)
+
+async def count_entities(session, base_url):
+    """Number of Users and Groups currently in the catalog."""
+    async with session.get(
+        f"{base_url}/api/catalog/entities/by-query",
+        headers=headers(),
+        params=[("filter", "kind=user"), ("filter", "kind=group"), ("limit", "1")]
+    ) as response:
+        check_response(response, 200)
+        return (await response.json())["totalItems"]
+
+async def register_location(session, base_url, location_file):
+    async with session.post(
+        f"{base_url}/api/catalog/locations",
+        headers=headers(),
+        data=json.dumps({"type": "file", "target": os.path.abspath(location_file)})
+    ) as response:
+        check_response(response, 201)
+        return (await response.json())["location"]["id"]
+
+async def unregister_location(session, base_url, location_id):
+    async with session.delete(
+        f"{base_url}/api/catalog/locations/{location_id}",
+        headers=headers()
+    ) as response:
+        check_response(response, 204)
+
+async def wait_for_count(session, base_url, target, poll_interval, timeout, increasing=True):
+    """Poll until the catalog holds `target` Users and Groups, return the elapsed time or None on timeout."""
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < timeout:
+        count = await count_entities(session, base_url)
+        if (increasing and count >= target) or (not increasing and count <= target):
+            return time.perf_counter() - start_time
+        await asyncio.sleep(poll_interval)
+    return None
+
+async def time_ingestion(session, args, location_file):
+    stats = describe_location(location_file)
+    expected = stats["users"] + stats["groups"]
+    baseline = await count_entities(session, args.base_url)
+
+    print("-" * 95)
+    print(f"Ingesting {location_file}: {expected} entities in {stats['files']} files ({stats['bytes'] / 1e6:.1f} MB)")
+    if stats["invalid"]:
+        print(f"Not waiting for {stats['invalid']} Users and Groups with a name the catalog rejects")
+    start_time = time.perf_counter()
+    location_id = await register_location(session, args.base_url, location_file)
+    elapsed = await wait_for_count(session, args.base_url, baseline + expected, args.poll_interval, args.timeout)
+    if elapsed is None:
+        ingested = await count_entities(session, args.base_url) - baseline
+        print(f"Timed out after {args.timeout:g} seconds with {ingested} of {expected} entities ingested, check the catalog logs for rejected entities")
+    else:
+        elapsed = time.perf_counter() - start_time
+        print(f"Ingested in {elapsed:.1f} seconds: {expected / elapsed:.0f} entities/sec, {stats['files'] / elapsed:.1f} files/sec")
+
+    await unregister_location(session, args.base_url, location_id)
+    removed = await wait_for_count(session, args.base_url, baseline, args.poll_interval, args.timeout, increasing=False)
+    if removed is None:
+        print("WARNING: entities were not removed after unregistering the location, later runs may be skewed")
+
+    return {
+        "location": location_file,
+        **stats,
+        "entities": expected,
+        "seconds": elapsed,
+        "entities_per_second": expected / elapsed if elapsed else None,
+        "files_per_second": stats["files"] / elapsed if elapsed else None,
+        "bytes_per_file": stats["bytes"] / stats["files"] if stats["files"] else None,
+    }
+
+async def main(args):
+    if AUTH_TOKEN is None:
+        print("ERROR: export the token to use first!")
+        sys.exit(1)
+    results = []
+    async with aiohttp.ClientSession() as session:
+        for location_file in args.locations:
+            results.append(await time_ingestion(session, args, location_file))
+
+    print("=" * 95)
+    print(f"{'location':<50}{'files':>8}{'entities':>10}{'seconds':>10}{'entities/sec':>15}")
+    for result in results:
+        seconds = f"{result['seconds']:.1f}" if result["seconds"] else "timeout"
+        rate = f"{result['entities_per_second']:.0f}" if result["entities_per_second"] else "-"
+        print(f"{result['location']:<50}{result['files']:>8}{result['entities']:>10}{seconds:>10}{rate:>15}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure catalog ingestion throughput for generated Location files.")
+    parser.add_argument("locations", nargs="+", help="Top level Location files, e.g. catalog-entities/extreme-org/all.local.yaml")
+    parser.add_argument("--base-url", default=BASE_URL, help=f"Backstage backend URL (default: {BASE_URL})")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds between two entity counts")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds to wait for a location to be ingested")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -0,0 +1,187 @@
+import json
+
+# Latencies are counted in microseconds. Below 2^SUB_BUCKET_BITS every value
+# has its own bucket, above it every power of two is split into
+# 2^(SUB_BUCKET_BITS - 1) buckets, so a bucket is never wider than 1/128 of its
+# values and the midpoint reported for it is within 0.4% of them.
+SUB_BUCKET_BITS = 8
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_BUCKETS = SUB_BUCKETS >> 1
+# Anything above 2^36 us (19 hours) is counted in the last bucket
+HIGHEST_BITS = 36
+BUCKETS = SUB_BUCKETS + (HIGHEST_BITS - SUB_BUCKET_BITS) * HALF_BUCKETS
+PERCENTILES = (50, 90, 99, 99.9)
+
+def bucket_index(micros):
+    if micros < SUB_BUCKETS:
+        return max(micros, 0)
+    shift = micros.bit_length() - SUB_BUCKET_BITS
+    return min(SUB_BUCKETS + (shift - 1) * HALF_BUCKETS + (micros >> shift) - HALF_BUCKETS, BUCKETS - 1)
+
+def bucket_midpoint(index):
+    """Middle of the values, in microseconds, counted in a bucket."""
+    if index < SUB_BUCKETS:
+        return float(index)
+    shift, offset = divmod(index - SUB_BUCKETS, HALF_BUCKETS)
+    shift += 1
+    return float(((offset + HALF_BUCKETS) << shift) + ((1 << shift) - 1) / 2)
+
+def percentile_name(percent):
+    return f"p{percent:g}".replace(".", "_")
+
+class LatencyHistogram:
+    """Fixed-memory log-bucketed histogram of latencies in seconds, in the spirit of HdrHistogram.
+
+    Recording is O(1) and memory does not grow with the number of requests,
+    histograms of different tasks or processes are combined with `merge`. The
+    minimum, maximum and sum are kept exactly, percentiles are within 0.4%.
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds, count=1):
+        self.counts[bucket_index(round(seconds * 1e6))] += count
+        self.count += count
+        self.total += seconds * count
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def percentile(self, percent):
+        """Nearest-rank percentile in seconds, 0 for an empty histogram."""
+        if not self.count:
+            return 0.0
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                # The exact extremes beat the middle of their bucket
+                return min(max(bucket_midpoint(index) / 1e6, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        summary = {"count": self.count, "min": self.min or 0.0, "mean": self.mean()}
+        for percent in PERCENTILES:
+            summary[percentile_name(percent)] = self.percentile(percent)
+        summary["max"] = self.max or 0.0
+        return summary
+
+    def to_dict(self):
+        return {
+            "summary": self.summary(),
+            "total": self.total,
+            "sub_bucket_bits": SUB_BUCKET_BITS,
+            "counts": {str(index): count for index, count in enumerate(self.counts) if count},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("sub_bucket_bits", SUB_BUCKET_BITS) != SUB_BUCKET_BITS:
+            raise ValueError(f"histogram was recorded with {data['sub_bucket_bits']} sub-bucket bits, not {SUB_BUCKET_BITS}")
+        histogram = cls()
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data["summary"]["count"]
+        histogram.total = data["total"]
+        if histogram.count:
+            histogram.min = data["summary"]["min"]
+            histogram.max = data["summary"]["max"]
+        return histogram
+
+def format_summary(summary):
+    if not summary["count"]:
+        return "no requests"
+    percentiles = ", ".join(f"p{percent:g}: {summary[percentile_name(percent)]:.3f}" for percent in PERCENTILES)
+    return f"{summary['count']} requests, mean: {summary['mean']:.3f}, {percentiles}, max: {summary['max']:.3f} seconds"
+
+class LatencyRecorder:
+    """Latency histograms per endpoint and per user, mergeable and exportable as JSON."""
+
+    def __init__(self):
+        self.histograms = {}
+
+    def histogram(self, endpoint, user=None):
+        key = (endpoint, user)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        return histogram
+
+    def record(self, endpoint, seconds, user=None):
+        self.histogram(endpoint, user).record(seconds)
+
+    def endpoints(self):
+        return sorted({endpoint for endpoint, _ in self.histograms})
+
+    def users(self, endpoint):
+        return sorted(user for name, user in self.histograms if name == endpoint and user is not None)
+
+    def endpoint_histogram(self, endpoint):
+        """Every latency recorded for `endpoint`, whatever the user."""
+        merged = LatencyHistogram()
+        for (name, _), histogram in self.histograms.items():
+            if name == endpoint:
+                merged.merge(histogram)
+        return merged
+
+    def merge(self, other):
+        for (endpoint, user), histogram in other.histograms.items():
+            self.histogram(endpoint, user).merge(histogram)
+        return self
+
+    def to_dict(self):
+        return {
+            endpoint: {
+                "all": self.endpoint_histogram(endpoint).to_dict(),
+                "users": {user: self.histograms[(endpoint, user)].to_dict() for user in self.users(endpoint)},
+                **({"unattributed": self.histograms[(endpoint, None)].to_dict()} if (endpoint, None) in self.histograms else {}),
+            }
+            for endpoint in self.endpoints()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        recorder = cls()
+        for endpoint, histograms in data.items():
+            for user, histogram in histograms["users"].items():
+                recorder.histograms[(endpoint, user)] = LatencyHistogram.from_dict(histogram)
+            if "unattributed" in histograms:
+                recorder.histograms[(endpoint, None)] = LatencyHistogram.from_dict(histograms["unattributed"])
+        return recorder
+
+    def write_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    @classmethod
+    def read_json(cls, path):
+        with open(path) as file:
+            return cls.from_dict(json.load(file))
+
+    def print_report(self):
+        for endpoint in self.endpoints():
+            print(f"{endpoint}: {format_summary(self.endpoint_histogram(endpoint).summary())}")
+            users = self.users(endpoint)
+            if len(users) > 1:
+                for user in users:
+                    print(f"  {user}: {format_summary(self.histograms[(endpoint, user)].summary())}")
@@ -0,0 +1,211 @@
+import math
+import time
+import queue
+import random
+import asyncio
+import argparse
+import multiprocessing
+from collections import Counter
+
+from latency_histogram import LatencyHistogram, LatencyRecorder, format_summary
+
+ARRIVALS = ["fixed", "poisson", "ramp"]
+DEFAULT_MAX_IN_FLIGHT = 256
+DEFAULT_REPORT_INTERVAL = 10.0
+
+def arrival_offsets(arrival, rate, duration, ramp_to=None, rng=None):
+    """Intended send times, in seconds from the start, of an open-loop run.
+
+    - `fixed` one request every 1 / `rate` seconds
+    - `poisson` exponentially distributed gaps averaging 1 / `rate` seconds
+    - `ramp` a rate growing linearly from `rate` to `ramp_to` over `duration`
+    """
+    if not all(0 < value < math.inf for value in (rate, duration, rate if ramp_to is None else ramp_to)):
+        raise ValueError(f"rate, ramp_to and duration must be positive and finite, not {rate}, {ramp_to} and {duration}")
+    rng = rng or random.Random()
+    if arrival == "poisson":
+        offset = rng.expovariate(rate)
+        while offset < duration:
+            yield offset
+            offset += rng.expovariate(rate)
+        return
+    if arrival == "ramp" and ramp_to is not None and ramp_to != rate:
+        # The i-th request is sent when the integral of the rate reaches i:
+        # rate * t + slope * t^2 / 2 = i
+        slope = (ramp_to - rate) / duration
+        index = 0
+        while True:
+            discriminant = rate * rate + 2 * slope * index
+            if discriminant < 0:
+                return
+            offset = (math.sqrt(discriminant) - rate) / slope
+            if offset >= duration:
+                return
+            yield offset
+            index += 1
+    index = 0
+    while index / rate < duration:
+        yield index / rate
+        index += 1
+
+class OpenLoopResult:
+    """Latencies of an open-loop run, measured from the intended send times."""
+
+    def __init__(self, latencies=None):
+        self.latencies = latencies if latencies is not None else LatencyHistogram()
+        self.service_times = LatencyHistogram()
+        self.errors = 0
+        self.late_sends = 0
+        self.started = None
+        self.finished = None
+
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def achieved_rate(self):
+        elapsed = self.elapsed()
+        return self.latencies.count / elapsed if elapsed > 0 else 0.0
+
+async def run_open_loop(request, offsets, max_in_flight=DEFAULT_MAX_IN_FLIGHT, late_after=0.01, latencies=None):
+    """Send `request()` at every offset of `offsets`, whatever the responses are doing.
+
+    A request that finds `max_in_flight` requests outstanding waits for a slot,
+    and the wait counts towards its latency: latencies are measured from the
+    time the request should have been sent, so a server that falls behind
+    shows up in the results instead of slowing the senders down (coordinated
+    omission). Requests that start more than `late_after` seconds after their
+    intended time are counted as late sends. Latencies are recorded as they
+    come in, into the `latencies` histogram when one is given.
+    """
+    result = OpenLoopResult(latencies)
+    slots = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+
+    async def send(intended):
+        async with slots:
+            sent = time.perf_counter()
+            if sent - intended > late_after:
+                result.late_sends += 1
+            try:
+                await request()
+            except Exception:
+                result.errors += 1
+                return
+            done = time.perf_counter()
+        result.latencies.record(done - intended)
+        result.service_times.record(done - sent)
+
+    result.started = time.perf_counter()
+    for offset in offsets:
+        intended = result.started + offset
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(send(intended))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    result.finished = time.perf_counter()
+    return result
+
+def split_share(total, index, parts):
+    """The part of `total` (requests, users...) that worker `index` of `parts` takes."""
+    return total // parts + (1 if index < total % parts else 0)
+
+def _worker_main(worker, snapshot, index, processes, args, reports, interval):
+    async def run():
+        async def report_periodically():
+            while True:
+                await asyncio.sleep(interval)
+                reports.put((index, False, snapshot()))
+        reporter = asyncio.create_task(report_periodically())
+        try:
+            await worker(index, processes, args)
+        finally:
+            reporter.cancel()
+    try:
+        asyncio.run(run())
+    finally:
+        # Sent even when the worker exits early, so the coordinator never waits for it
+        reports.put((index, True, snapshot()))
+
+def merge_snapshots(snapshots):
+    """One LatencyRecorder and Counter out of the {"latencies", "counters"} snapshots of the workers."""
+    recorder = LatencyRecorder()
+    counters = Counter()
+    for snapshot in snapshots:
+        recorder.merge(LatencyRecorder.from_dict(snapshot["latencies"]))
+        counters.update(snapshot["counters"])
+    return recorder, counters
+
+def run_workers(worker, snapshot, processes, args, interval=DEFAULT_REPORT_INTERVAL, progress=None):
+    """Run `await worker(index, processes, args)` in `processes` processes, each with its own event loop.
+
+    Every `interval` seconds and once they are done, the workers send
+    `snapshot()`, their cumulative latency histograms and counters. The
+    coordinator merges the latest snapshot of every worker, hands the result
+    to `progress(recorder, counters, elapsed)` at every interval and returns it
+    at the end together with the exit codes of the workers. `worker` and
+    `snapshot` must be module level functions.
+    """
+    reports = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_worker_main, args=(worker, snapshot, index, processes, args, reports, interval))
+        for index in range(processes)
+    ]
+    start_time = time.perf_counter()
+    for process in workers:
+        process.start()
+
+    latest = {}
+    finished = set()
+    last_progress = start_time
+    while len(finished) < processes:
+        try:
+            index, done, data = reports.get(timeout=interval)
+            latest[index] = data
+            if done:
+                finished.add(index)
+        except queue.Empty:
+            # A worker killed before its last report would be waited for forever
+            finished.update(index for index, process in enumerate(workers) if not process.is_alive() and process.exitcode != 0)
+        now = time.perf_counter()
+        if progress is not None and now - last_progress >= interval and len(finished) < processes:
+            last_progress = now
+            progress(*merge_snapshots(latest.values()), now - start_time)
+
+    for process in workers:
+        process.join()
+    # Reports still in flight from workers that were counted out when they died
+    while True:
+        try:
+            index, _, data = reports.get(timeout=0.1)
+        except queue.Empty:
+            break
+        latest[index] = data
+    recorder, counters = merge_snapshots(latest.values())
+    return recorder, counters, [process.exitcode for process in workers]
+
+def print_progress(recorder, counters, elapsed):
+    for endpoint in recorder.endpoints():
+        # Phase histograms (`<endpoint>.<phase>`) are left for the final report
+        if "." not in endpoint:
+            print(f"[{elapsed:.0f}s] {endpoint}: {format_summary(recorder.endpoint_histogram(endpoint).summary())}")
+
+def add_process_arguments(parser):
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes generating the load, each with its own event loop and connections (default: 1)")
+    parser.add_argument("--report-interval", type=float, default=DEFAULT_REPORT_INTERVAL, help=f"Seconds between the merged reports of the workers (default: {DEFAULT_REPORT_INTERVAL:g})")
+
+def positive_float(value):
+    number = float(value)
+    if not 0 < number < math.inf:
+        raise argparse.ArgumentTypeError(f"must be positive and finite, not {value}")
+    return number
+
+def add_load_arguments(parser):
+    parser.add_argument("--rate", type=positive_float, help="Open loop: requests per second to send, instead of the closed loop batches")
+    parser.add_argument("--duration", type=positive_float, default=30.0, help="Open loop: seconds to send requests for (default: 30)")
+    parser.add_argument("--arrival", choices=ARRIVALS, default="fixed", help="Open loop: spacing of the requests (default: fixed)")
+    parser.add_argument("--ramp-to", type=positive_float, help="Open loop: rate reached at the end of a ramp arrival")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT, help=f"Open loop: outstanding requests at most (default: {DEFAULT_MAX_IN_FLIGHT})")
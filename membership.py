@@ -0,0 +1,141 @@
+import random
+import itertools
+from collections import Counter
+
+# NumPy draws a million memberships in one call, without it the same
+# distributions are sampled in bulk with random.choices
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+GROUP_SIZE_DISTRIBUTIONS = ["fixed", "uniform", "zipf"]
+MEMBERSHIP_DISTRIBUTIONS = ["fixed", "uniform", "zipf"]
+DEFAULT_ZIPF_EXPONENT = 1.2
+# Rounds of redrawing duplicate extra groups before the missing ones are filled in order
+MAX_REDRAWS = 8
+
+class MembershipModel:
+    """How generated users are spread over groups.
+
+    - `group_sizes` splits the users evenly (`fixed`), picks each user's main
+      group with equal probability (`uniform`) or with a probability
+      proportional to 1 / rank ^ `zipf_exponent` (`zipf`, a few big teams and
+      a long tail of small ones, the big ones scattered over the org)
+    - `memberships` gives every user exactly `memberships_per_user` groups
+      (`fixed`), between 1 and that many with equal probability (`uniform`) or
+      with a probability proportional to 1 / count ^ `zipf_exponent` (`zipf`)
+
+    Extra groups are drawn with the same weights as the main ones, so popular
+    teams also collect most of the extra members.
+    """
+
+    def __init__(self, group_sizes="fixed", memberships="fixed", memberships_per_user=1, zipf_exponent=DEFAULT_ZIPF_EXPONENT):
+        self.group_sizes_distribution = group_sizes
+        self.memberships_distribution = memberships
+        self.memberships_per_user = max(1, memberships_per_user)
+        self.zipf_exponent = zipf_exponent
+        self.weights_cache = {}
+
+    @classmethod
+    def from_args(cls, args):
+        """Build the model from the command line, or None when no membership option was given."""
+        options = {
+            "group_sizes": args.group_sizes,
+            "memberships": args.memberships,
+            "memberships_per_user": args.memberships_per_user,
+            "zipf_exponent": args.zipf_exponent,
+        }
+        options = {name: value for name, value in options.items() if value is not None}
+        return cls(**options) if options else None
+
+    def rng(self):
+        # Seeded from `random` so --seed (and per root seeding) covers NumPy too
+        return numpy.random.default_rng(random.getrandbits(64))
+
+    def weights(self, groups):
+        """Cumulative popularity of every group, fixed for the lifetime of the model."""
+        cum_weights = self.weights_cache.get(groups)
+        if cum_weights is None:
+            if self.group_sizes_distribution == "zipf":
+                ranks = list(range(1, groups + 1))
+                random.shuffle(ranks)
+                weights = [rank ** -self.zipf_exponent for rank in ranks]
+            else:
+                weights = [1.0] * groups
+            cum_weights = self.weights_cache[groups] = list(itertools.accumulate(weights))
+        return cum_weights
+
+    def draw_groups(self, groups, count):
+        """`count` group indices drawn with replacement according to the weights."""
+        if self.group_sizes_distribution != "zipf":
+            if numpy is not None:
+                return self.rng().integers(groups, size=count).tolist()
+            return random.choices(range(groups), k=count)
+        cum_weights = self.weights(groups)
+        if numpy is not None:
+            # Inverse transform sampling over the same cumulative weights
+            points = self.rng().random(count) * cum_weights[-1]
+            return numpy.searchsorted(numpy.asarray(cum_weights), points, side="right").clip(0, groups - 1).tolist()
+        return random.choices(range(groups), cum_weights=cum_weights, k=count)
+
+    def group_sizes(self, groups, users):
+        """Number of users whose main group is each of the `groups` groups."""
+        if groups <= 0:
+            return []
+        if self.group_sizes_distribution == "fixed":
+            return [users // groups + (1 if index < users % groups else 0) for index in range(groups)]
+        counts = Counter(self.draw_groups(groups, users))
+        return [counts[index] for index in range(groups)]
+
+    def primaries(self, groups, users):
+        """Main group of every user, in random user order."""
+        primaries = [index for index, size in enumerate(self.group_sizes(groups, users)) for _ in range(size)]
+        random.shuffle(primaries)
+        return primaries
+
+    def membership_counts(self, users, groups):
+        """Number of groups of every user, never more than there are groups."""
+        most = min(self.memberships_per_user, groups)
+        if self.memberships_distribution == "fixed" or most == 1:
+            return [most] * users
+        counts = range(1, most + 1)
+        weights = [1.0] * most if self.memberships_distribution == "uniform" else [count ** -self.zipf_exponent for count in counts]
+        if numpy is not None:
+            return self.rng().choice(numpy.arange(1, most + 1), size=users, p=numpy.asarray(weights) / sum(weights)).tolist()
+        return random.choices(counts, cum_weights=list(itertools.accumulate(weights)), k=users)
+
+    def memberships(self, primaries, groups):
+        """memberOf group indices of every user, its main group first."""
+        counts = self.membership_counts(len(primaries), groups)
+        result = [[primary] for primary in primaries]
+        pending = [user for user, count in enumerate(counts) if count > 1]
+
+        # Every round draws the missing groups of all users in one go, the
+        # duplicates it produces are drawn again in the next round
+        for _ in range(MAX_REDRAWS):
+            if not pending:
+                break
+            draws = iter(self.draw_groups(groups, sum(counts[user] - len(result[user]) for user in pending)))
+            for user in pending:
+                member_of = result[user]
+                for _ in range(counts[user] - len(member_of)):
+                    group = next(draws)
+                    if group not in member_of:
+                        member_of.append(group)
+            pending = [user for user in pending if len(result[user]) < counts[user]]
+
+        for user in pending:
+            member_of = result[user]
+            for group in range(groups):
+                if len(member_of) == counts[user]:
+                    break
+                if group not in member_of:
+                    member_of.append(group)
+        return result
+
+def add_membership_arguments(parser):
+    parser.add_argument("--group-sizes", choices=GROUP_SIZE_DISTRIBUTIONS, help="How the users are spread over their main groups (default: fixed)")
+    parser.add_argument("--memberships", choices=MEMBERSHIP_DISTRIBUTIONS, help="Distribution of the number of groups per user (default: fixed)")
+    parser.add_argument("--memberships-per-user", type=int, help="Groups per user, exactly for fixed and at most for uniform and zipf memberships (default: 1)")
+    parser.add_argument("--zipf-exponent", type=float, help=f"Exponent of the zipf distributions (default: {DEFAULT_ZIPF_EXPONENT})")
@@ -10,6 +10,9 @@ import time
 import argparse
 import sys
 
+from latency_histogram import LatencyRecorder, format_summary
+from load_engine import add_process_arguments, run_workers, split_share, print_progress
+
 USER="user:default/cyber-stalker-bit"
 BASE_URL = "<base_url_here>"  # Replace with your actual base URL
 DEFAULT_NUM_REQUESTS = 1000
@@ -25,6 +28,7 @@ ssl_context.verify_mode = ssl.CERT_NONE
 
 successful_read_requests = 0
 counter_lock = asyncio.Lock()
+latency_recorder = LatencyRecorder()
 
 async def createRole(role, roleContent, session):
     print(f"Create role: {role}")
@@ -221,15 +225,16 @@ async def deleteRoleAndPermissionForUser(reuse_session, shared_session):
                 await session.close()
     print(f"All roles and permissions deleted for {USER}")
 
-async def checkPermissionEvaluationLatency(reuse_session, shared_session):
+async def checkPermissionEvaluationLatency(reuse_session, shared_session, num_requests=DEFAULT_NUM_REQUESTS):
     minLatency = sys.float_info.max
     maxLatency = 0.0
     total_time = 0.0
-    for iteration in range(DEFAULT_NUM_REQUESTS):
+    for iteration in range(num_requests):
         try:
             session = shared_session or aiohttp.ClientSession()
             latency = await fetch_permission(shared_session or session, USER_TOKEN)
             total_time += latency
+            latency_recorder.record("permission", latency, USER)
 
             if latency < minLatency:
                 minLatency = latency
@@ -242,27 +247,57 @@ async def checkPermissionEvaluationLatency(reuse_session, shared_session):
             if not reuse_session:
                 await session.close()
 
-    average_iteration_time = total_time / DEFAULT_NUM_REQUESTS
+    average_iteration_time = total_time / num_requests
     print(f"Max latency value is {maxLatency:.3f} seconds")
     print(f"Min latency value is {minLatency:.3f} seconds")
     print(f"Average request duration is time: {average_iteration_time:.3f} seconds")
+    print(f"Latency: {format_summary(latency_recorder.histogram('permission', USER).summary())}")
 
-async def main(reuse_session):
-    if reuse_session:
-        shared_session = aiohttp.ClientSession()
-    else:
-        shared_session = None
+async def withSession(reuse_session, steps):
+    """Await `steps(reuse_session, shared_session)`, with a session shared by every request when asked."""
+    shared_session = aiohttp.ClientSession() if reuse_session else None
     try:
-        await createRoleAndPermissionForUser(reuse_session, shared_session)
-        await checkPermissionEvaluationLatency(reuse_session, shared_session)
+        await steps(reuse_session, shared_session)
     finally:
-        await deleteRoleAndPermissionForUser(reuse_session, shared_session)
-        if reuse_session and shared_session:
+        if shared_session:
             await shared_session.close()
 
+async def checkWorker(index, processes, args):
+    """One of --processes workers: its share of the requests, over its own sessions."""
+    num_requests = split_share(args.num_requests, index, processes)
+    if num_requests == 0:
+        # More workers than requests, this one has nothing to send
+        return
+    await withSession(args.reuse_session, lambda reuse_session, shared_session: checkPermissionEvaluationLatency(reuse_session, shared_session, num_requests))
+
+def snapshot():
+    return {"latencies": latency_recorder.to_dict(), "counters": {}}
+
+def main(reuse_session, output=None, processes=1, report_interval=None, args=None, num_requests=DEFAULT_NUM_REQUESTS):
+    # Synchronous, so no event loop (nor the session it holds) sits idle while
+    # run_workers blocks on the worker processes
+    asyncio.run(withSession(reuse_session, createRoleAndPermissionForUser))
+    try:
+        recorder = latency_recorder
+        if processes > 1:
+            # The roles are created and deleted once, only the evaluation load is spread
+            recorder, _, exit_codes = run_workers(checkWorker, snapshot, processes, args, report_interval, print_progress)
+            print(f"Latency over {processes} processes: {format_summary(recorder.endpoint_histogram('permission').summary())}")
+            if any(exit_codes):
+                print(f"ERROR: worker processes exited with {exit_codes}")
+        else:
+            asyncio.run(withSession(reuse_session, lambda reuse_session, shared_session: checkPermissionEvaluationLatency(reuse_session, shared_session, num_requests)))
+        if output:
+            recorder.write_json(output)
+    finally:
+        asyncio.run(withSession(reuse_session, deleteRoleAndPermissionForUser))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run the fetch permission evaluation latency checker.")
     parser.add_argument("--reuse-session", action="store_true", help="Reuse a single session for all requests")
+    parser.add_argument("--num-requests", type=int, default=DEFAULT_NUM_REQUESTS, help=f"Number of permission requests to send, spread over the processes (default: {DEFAULT_NUM_REQUESTS})")
+    parser.add_argument("--output", help="Write the latency histogram as JSON to this file")
+    add_process_arguments(parser)
     args = parser.parse_args()
 
-    asyncio.run(main(args.reuse_session))
+    main(args.reuse_session, args.output, args.processes, args.report_interval, args, args.num_requests)
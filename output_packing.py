@@ -0,0 +1,35 @@
+import math
+
+def entities_per_file(total_entities, files):
+    """Number of entities per file needed to spread `total_entities` over `files` files."""
+    if files <= 0 or total_entities <= 0:
+        return 0
+    return math.ceil(total_entities / files)
+
+def plan_locations(name, targets, fanout):
+    """Split a Location's targets into a tree of Locations with at most `fanout` targets each.
+
+    Returns the targets of the top level Location and the intermediate
+    Locations as (name, targets) pairs, deepest level first. Intermediate
+    Locations are meant to be written next to the files they point at.
+    """
+    if fanout < 2 or len(targets) <= fanout:
+        return list(targets), []
+
+    intermediates = []
+    level = 1
+    while len(targets) > fanout:
+        parents = []
+        for index in range(0, len(targets), fanout):
+            parent = f"{name}-location-{level}-{index // fanout:05d}"
+            intermediates.append((parent, targets[index:index + fanout]))
+            parents.append(parent)
+        targets = parents
+        level += 1
+    return targets, intermediates
+
+def write_location_tree(serializer, writer, folder, intermediates):
+    """Write every intermediate Location of a plan into `folder`."""
+    for location_name, targets in intermediates:
+        content = serializer.location(location_name, [f"./{target}.local.yaml" for target in targets])
+        writer.handle(f"{folder}/{location_name}.local.yaml").write(content)
@@ -1,7 +1,14 @@
 import asyncio
 import aiohttp
-import time
+import json
 import sys
+import argparse
+
+from collections import Counter
+
+from load_engine import arrival_offsets, run_open_loop, add_load_arguments, add_process_arguments, run_workers, split_share, print_progress
+from latency_histogram import LatencyRecorder, format_summary
+from request_tracing import RequestPhases, trace_config, record_phases, format_phases
 
 PERMISSION_ENDPOINT_URL = "http://localhost:7007/api/permission/authorize"
 CATALOG_ENDPOINT_URL = "http://localhost:7007/api/catalog/entities"
@@ -19,10 +26,16 @@ TOKENS = [
 EXPECTED_RESULT = [
   "ALLOW",
 ]
+latency_recorder = LatencyRecorder()
+counters = Counter()
 
 async def fetch_permission(session, i, auth_token):
-    """Make a single async POST request to the Permission API."""
-    start_time_inner = time.time()
+    """Make a single async POST request to the Permission API.
+
+    Returns the seconds from sending the request to decoding its JSON body, the
+    phases in between are recorded per user.
+    """
+    phases = RequestPhases()
     payload = '{"items":[{"id":"9c43936f-4bc1-44e5-9ff0-9b9139cce546",' \
               '"permission":{"attributes":{"action":"read"},' \
               '"name":"catalog.entity.read","type":"resource",' \
@@ -34,47 +47,60 @@ async def fetch_permission(session, i, auth_token):
             "Authorization": f"Bearer {auth_token}",
             "Content-Type": "application/json"
         },
-        data=payload
+        data=payload,
+        trace_request_ctx=phases
     ) as response:
-        end_time_inner = time.time()
-
         if response.status == 401:
             print(await response.json())
             print(f"ERROR: Update token for user: {LIST_OF_USERS[i]}!")
             sys.exit(1)
         if response.status != 200:
-            print(f"Unexpected error. Status code is {response.status}.")
-            sys.exit(1)
+            # Raised rather than exiting, the open loop counts it as an error and goes on
+            counters[f"permission status {response.status}"] += 1
+            raise ValueError(f"Unexpected error. Status code is {response.status}.")
 
-        result = (await response.json())['items'][0]['result']
+        body = await response.read()
+        phases.mark("body_end")
+        result = json.loads(body)['items'][0]['result']
+        phases.mark("json_end")
         if (result != EXPECTED_RESULT[i]):
           print(f"Expected result: ${EXPECTED_RESULT[i]} does not match result: ${result}")
 
-        return end_time_inner - start_time_inner
+        return record_phases(latency_recorder, "permission", phases, LIST_OF_USERS[i])
 
 async def fetch_catalog(session, i, auth_token):
-    """Make a single async GET request to the Catalog API."""
-    start_time_inner = time.time()
+    """Make a single async GET request to the Catalog API.
+
+    Returns the seconds from sending the request to decoding its JSON body, the
+    phases in between are recorded per user.
+    """
+    phases = RequestPhases()
 
     async with session.get(
         CATALOG_ENDPOINT_URL,
         headers={
             "Authorization": f"Bearer {auth_token}",
             "Content-Type": "application/json"
-        }
+        },
+        trace_request_ctx=phases
     ) as response:
-        end_time_inner = time.time()
-
         if response.status == 401:
             print(f"ERROR: Update token for user: {LIST_OF_USERS[i]}!")
             sys.exit(1)
         if response.status != 200:
-            print(f"Unexpected error. Status code is {response.status}.")
-            sys.exit(1)
+            # Raised rather than exiting, the open loop counts it as an error and goes on
+            counters[f"catalog status {response.status}"] += 1
+            raise ValueError(f"Unexpected error. Status code is {response.status}.")
 
-        return end_time_inner - start_time_inner
+        # The entity list can be several MB, reading and decoding it is part of the request
+        body = await response.read()
+        phases.mark("body_end")
+        json.loads(body)
+        phases.mark("json_end")
 
-async def run_tests_for_user(i, session):
+        return record_phases(latency_recorder, "catalog", phases, LIST_OF_USERS[i])
+
+async def run_tests_for_user(i, session, num_requests=NUM_REQUESTS):
     """Run both Permission and Catalog API tests for a specific user."""
     print(f"Performance test of user: {LIST_OF_USERS[i]}")
     print(f"Expected result should be: {EXPECTED_RESULT[i]}")
@@ -84,62 +110,156 @@ async def run_tests_for_user(i, session):
     total_time = 0
     average_time = 0
     average_time_single_request = 0
+    completed = 0
 
     print("-" * 95)
     print("Permission API tests")
-    print(f"Calling {NUM_REQUESTS} request over {NUM_REQUESTS_TWO} iterations")
+    print(f"Calling {num_requests} request over {NUM_REQUESTS_TWO} iterations")
     for j in range(NUM_REQUESTS_TWO):
-        tasks = [fetch_permission(session, i, TOKENS[i]) for _ in range(NUM_REQUESTS)]
-        results = await asyncio.gather(*tasks)
+        tasks = [fetch_permission(session, i, TOKENS[i]) for _ in range(num_requests)]
+        # Failed requests are counted like in the open loop instead of ending the run
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        results = [result for result in results if not isinstance(result, Exception)]
+        counters["permission errors"] += len(errors)
+        if errors:
+            print(f"{len(errors)} of {num_requests} permission requests failed, first error: {errors[0]!r}")
+        for latency in results:
+            latency_recorder.record("permission", latency, LIST_OF_USERS[i])
 
         total_time_inner = sum(results)
-        average_time_inner = total_time_inner / NUM_REQUESTS
+        completed += len(results)
 
         total_time += total_time_inner
     
     average_time = total_time / NUM_REQUESTS_TWO
-    average_time_single_request = total_time / NUM_REQUESTS_TWO / NUM_REQUESTS
+    average_time_single_request = total_time / completed if completed else 0.0
 
     print("-" * 95)
     print(f"Permission tests completed for user: {LIST_OF_USERS[i]}")
+    print(f"Latency: {format_summary(latency_recorder.histogram('permission', LIST_OF_USERS[i]).summary())}")
+    print(f"Phases: {format_phases(latency_recorder, 'permission', LIST_OF_USERS[i])}")
     print(f"Average time taken for a single request: {average_time_single_request:.3f} seconds")
-    print(f"Average time taken for {NUM_REQUESTS} requests over {NUM_REQUESTS_TWO} iterations: {average_time:.3f} seconds")
-    print(f"Total time taken for {NUM_REQUESTS} requests of {NUM_REQUESTS_TWO} iterations: {total_time:.3f} seconds")
+    print(f"Average time taken for {num_requests} requests over {NUM_REQUESTS_TWO} iterations: {average_time:.3f} seconds")
+    print(f"Total time taken for {num_requests} requests of {NUM_REQUESTS_TWO} iterations: {total_time:.3f} seconds")
     print("-" * 95)
     print("\n")
 
     total_time = 0
     average_time = 0
     average_time_single_request = 0
+    completed = 0
 
     print("-" * 95)
     print("Catalog API tests")
-    print(f"Calling {NUM_REQUESTS} request over {NUM_REQUESTS_TWO} iterations")
+    print(f"Calling {num_requests} request over {NUM_REQUESTS_TWO} iterations")
     for j in range(NUM_REQUESTS_TWO):
-        tasks = [fetch_catalog(session, i, TOKENS[i]) for _ in range(NUM_REQUESTS)]
-        results = await asyncio.gather(*tasks)
+        tasks = [fetch_catalog(session, i, TOKENS[i]) for _ in range(num_requests)]
+        # Failed requests are counted like in the open loop instead of ending the run
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        results = [result for result in results if not isinstance(result, Exception)]
+        counters["catalog errors"] += len(errors)
+        if errors:
+            print(f"{len(errors)} of {num_requests} catalog requests failed, first error: {errors[0]!r}")
+        for latency in results:
+            latency_recorder.record("catalog", latency, LIST_OF_USERS[i])
 
         total_time_inner = sum(results)
-        average_time_inner = total_time_inner / NUM_REQUESTS
+        completed += len(results)
 
         total_time += total_time_inner
 
     average_time = total_time / NUM_REQUESTS_TWO
-    average_time_single_request = total_time / NUM_REQUESTS_TWO / NUM_REQUESTS
+    average_time_single_request = total_time / completed if completed else 0.0
 
     print("-" * 95)
     print(f"Catalog tests completed for user: {LIST_OF_USERS[i]}")
+    print(f"Latency: {format_summary(latency_recorder.histogram('catalog', LIST_OF_USERS[i]).summary())}")
+    print(f"Phases: {format_phases(latency_recorder, 'catalog', LIST_OF_USERS[i])}")
     print(f"Average time taken for a single request: {average_time_single_request:.3f} seconds")
-    print(f"Average time taken for {NUM_REQUESTS} requests over {NUM_REQUESTS_TWO} iterations: {average_time:.3f} seconds")
-    print(f"Total time taken for {NUM_REQUESTS} requests of {NUM_REQUESTS_TWO} iterations: {total_time:.3f} seconds")
+    print(f"Average time taken for {num_requests} requests over {NUM_REQUESTS_TWO} iterations: {average_time:.3f} seconds")
+    print(f"Total time taken for {num_requests} requests of {NUM_REQUESTS_TWO} iterations: {total_time:.3f} seconds")
     print("-" * 95)
     print("\n")
 
-async def main():
+async def run_open_loop_for_user(i, session, args, share=1.0):
+    """Send Permission and Catalog API requests for a user at `share` of the target arrival rate."""
+    print(f"Open loop performance test of user: {LIST_OF_USERS[i]}")
+    print(f"Expected result should be: {EXPECTED_RESULT[i]}")
+    target_rate = args.rate * share
+    ramp_to = args.ramp_to * share if args.ramp_to is not None else None
+    rate = f"{target_rate:g} to {ramp_to:g}" if args.arrival == "ramp" and ramp_to is not None else f"{target_rate:g}"
+    for name, fetch in (("Permission", fetch_permission), ("Catalog", fetch_catalog)):
+        print("-" * 95)
+        print(f"{name} API tests")
+        print(f"Sending {rate} requests per second ({args.arrival}) for {args.duration:g} seconds, at most {args.max_in_flight} in flight")
+        offsets = arrival_offsets(args.arrival, target_rate, args.duration, ramp_to)
+        # Recorded straight into the user's histogram, so the periodic reports of --processes see them
+        latencies = latency_recorder.histogram(name.lower(), LIST_OF_USERS[i])
+        result = await run_open_loop(lambda: fetch(session, i, TOKENS[i]), offsets, args.max_in_flight, latencies=latencies)
+        counters[f"{name.lower()} errors"] += result.errors
+        counters[f"{name.lower()} late sends"] += result.late_sends
+
+        print("-" * 95)
+        print(f"{name} tests completed for user: {LIST_OF_USERS[i]}")
+        print(f"Requests completed: {result.latencies.count} at {result.achieved_rate():.1f} per second, {result.errors} errors, {result.late_sends} sent late")
+        print(f"Latency from the intended send time: {format_summary(result.latencies.summary())}")
+        print(f"Service time: {format_summary(result.service_times.summary())}")
+        print(f"Phases: {format_phases(latency_recorder, name.lower(), LIST_OF_USERS[i])}")
+        print("-" * 95)
+        print("\n")
+
+async def run_users(users, args, num_requests=NUM_REQUESTS, share=1.0):
+    """Run the closed loop batches, or the open loop when a rate is given, for the `users` indices."""
+    if args.rate is None:
+        async with aiohttp.ClientSession(trace_configs=[trace_config()]) as session:
+            tasks = [run_tests_for_user(i, session, num_requests) for i in users]
+            await asyncio.gather(*tasks)
+    else:
+        # The connection pool must not be the bottleneck that limits the requests in flight
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.max_in_flight), trace_configs=[trace_config()]) as session:
+            tasks = [run_open_loop_for_user(i, session, args, share) for i in users]
+            await asyncio.gather(*tasks)
+
+async def run_worker(index, processes, args):
+    """The users of one worker process, or its share of every user's load when there are fewer users than workers."""
+    if LIST_OF_USERS_LENGTH >= processes:
+        await run_users(range(index, LIST_OF_USERS_LENGTH, processes), args)
+        return
+    num_requests = split_share(NUM_REQUESTS, index, processes)
+    if args.rate is None and num_requests == 0:
+        # More workers than requests per batch, this one has nothing to send
+        return
+    await run_users(range(LIST_OF_USERS_LENGTH), args, num_requests, 1.0 / processes)
+
+def snapshot():
+    return {"latencies": latency_recorder.to_dict(), "counters": dict(counters)}
+
+def main():
     """Entry point to run tests for all users."""
-    async with aiohttp.ClientSession() as session:
-        tasks = [run_tests_for_user(i, session) for i in range(LIST_OF_USERS_LENGTH)]
-        await asyncio.gather(*tasks)
+    parser = argparse.ArgumentParser(description="Performance test of the Permission and Catalog APIs.")
+    add_load_arguments(parser)
+    add_process_arguments(parser)
+    parser.add_argument("--output", help="Write the latency histograms of every endpoint and user as JSON to this file")
+    args = parser.parse_args()
+
+    recorder, totals, exit_codes = latency_recorder, counters, []
+    if args.processes > 1:
+        recorder, totals, exit_codes = run_workers(run_worker, snapshot, args.processes, args, args.report_interval, print_progress)
+    else:
+        asyncio.run(run_users(range(LIST_OF_USERS_LENGTH), args))
+
+    print("=" * 95)
+    print("Latency of all users" + (f" over {args.processes} processes" if args.processes > 1 else ""))
+    recorder.print_report()
+    for name, count in sorted(totals.items()):
+        print(f"{name.capitalize()}: {count}")
+    if args.output:
+        recorder.write_json(args.output)
+    if any(exit_codes):
+        print(f"ERROR: worker processes exited with {exit_codes}")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -0,0 +1,86 @@
+import random
+
+# Permission and action pairs a generated role can be granted. The first one is
+# what the performance scripts check, so every role gets it before the others
+PERMISSION_CATALOG = [
+    (" catalog-entity", " read"),
+    (" catalog-entity", " update"),
+    (" catalog-entity", " delete"),
+    (" catalog.entity.create", " create"),
+    (" scaffolder.action.execute", " use"),
+    (" scaffolder.template.parameter.read", " read"),
+    (" scaffolder.template.step.read", " read"),
+]
+POLICY_BATCH_SIZE = 65536
+
+class PolicyModel:
+    """Parametric RBAC policy for generated groups.
+
+    - `role_fraction` of the candidate groups carry roles
+    - every carrying group gets `roles_per_group` roles; the first is named after the group
+    - every role gets `permissions_per_role` distinct permissions (at most the size of the catalog)
+    - every permission is allowed with probability `allow_ratio`, denied otherwise
+    - with probability `role_inheritance` a role also inherits a previously generated role
+    """
+
+    def __init__(self, roles_per_group=1, permissions_per_role=4, role_inheritance=0.0, allow_ratio=0.5, role_fraction=1.0):
+        self.roles_per_group = roles_per_group
+        self.permissions_per_role = max(0, min(permissions_per_role, len(PERMISSION_CATALOG)))
+        self.role_inheritance = role_inheritance
+        self.allow_ratio = allow_ratio
+        self.role_fraction = role_fraction
+        self.roles = 0
+        self.permissions = 0
+        self.inherited_roles = 0
+        self.role_names = []
+
+    @classmethod
+    def from_args(cls, args):
+        """Build the model from the command line, or None when no policy option was given."""
+        options = {
+            "roles_per_group": args.roles_per_group,
+            "permissions_per_role": args.permissions_per_role,
+            "role_inheritance": args.role_inheritance,
+            "allow_ratio": args.allow_ratio,
+            "role_fraction": args.role_fraction,
+        }
+        options = {name: value for name, value in options.items() if value is not None}
+        return cls(**options) if options else None
+
+    def role_rows(self, group_name):
+        rows = []
+        for index in range(self.roles_per_group):
+            role = group_name if index == 0 else f"{group_name}-{index}"
+            rows.append(f"g, group:default/{group_name}, role:default/{role}\r\n")
+            if self.role_names and random.random() < self.role_inheritance:
+                rows.append(f"g, role:default/{role}, role:default/{random.choice(self.role_names)}\r\n")
+                self.inherited_roles += 1
+            granted = PERMISSION_CATALOG[:1] + random.sample(PERMISSION_CATALOG[1:], max(self.permissions_per_role - 1, 0))
+            for permission, action in granted[:self.permissions_per_role]:
+                effect = " allow" if random.random() < self.allow_ratio else " deny"
+                rows.append(f"p, role:default/{role},{permission},{action},{effect}\r\n")
+            self.role_names.append(role)
+            self.roles += 1
+            self.permissions += self.permissions_per_role
+        # Same empty row between roles as csv.writer().writerow([])
+        rows.append("\r\n")
+        return "".join(rows)
+
+    def write(self, file, group_names):
+        """Stream the policy of the groups, in order, writing a batch of groups at a time."""
+        batch = []
+        for group_name in group_names:
+            if self.role_fraction < 1.0 and random.random() >= self.role_fraction:
+                continue
+            batch.append(self.role_rows(group_name))
+            if len(batch) >= POLICY_BATCH_SIZE:
+                file.write("".join(batch))
+                batch = []
+        file.write("".join(batch))
+
+def add_policy_arguments(parser):
+    parser.add_argument("--roles-per-group", type=int, help="Roles given to every group that carries roles (default: 1)")
+    parser.add_argument("--permissions-per-role", type=int, help=f"Permissions granted to every role, at most {len(PERMISSION_CATALOG)} (default: 4)")
+    parser.add_argument("--role-inheritance", type=float, help="Probability that a role also inherits a previously generated role (default: 0)")
+    parser.add_argument("--allow-ratio", type=float, help="Probability that a permission is allowed rather than denied (default: 0.5)")
+    parser.add_argument("--role-fraction", type=float, help="Fraction of the candidate groups that carry roles (default: 1)")
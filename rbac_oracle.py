@@ -0,0 +1,256 @@
+# This script computes, without a running Backstage, the ALLOW/DENY answer the
+# RBAC plugin is expected to give for a user, permission and action. It loads a
+# generated catalog (tree.py or hierarchy.py output) and its rbac-policy.csv, so
+# load tests can check every response of a 20k user org instead of the handful
+# of users filled in by hand in performance.py.
+#
+# Roles are resolved the way the RBAC plugin does it:
+# - a user gets the roles bound to it, to every group it is a member of and to
+#   every ancestor of those groups (spec.parent / spec.children)
+# - a role gets the permissions of the roles it inherits (`g, role:a, role:b`)
+# - a policy matches on the permission name or on its resource type, a matching
+#   deny wins over a matching allow and no matching policy is a deny
+#
+# Example of how to run the script:
+# python rbac_oracle.py catalog-entities/extreme-org/all.local.yaml --output expected.csv
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+
+from catalog_loader import iter_entities, entity_ref, own_ref
+
+DEFAULT_PERMISSION = "catalog.entity.read"
+DEFAULT_RESOURCE_TYPE = "catalog-entity"
+DEFAULT_ACTION = "read"
+
+def merge_masks(masks, other):
+    return masks[0] | other[0], masks[1] | other[1]
+
+def close_over(start, parents, own, cache, merge):
+    """Merge the `own` value of `start` with the values of everything reachable through `parents`.
+
+    Results are memoized in `cache` for every node visited. The walk keeps its
+    own stack so 10k deep chains do not hit the recursion limit. The nodes of a
+    cycle (a broken catalog, or `topology.py cycle`) all reach each other, so
+    the strongly connected components are found with Tarjan's algorithm and
+    every member of one is cached with the value of the whole component, only
+    once the component is complete:
+
+    >>> parents = {"a": {"b"}, "b": {"c"}, "c": {"a"}}
+    >>> cache = {}
+    >>> [sorted(close_over(node, parents, lambda node: {node}, cache, set.union)) for node in "acb"]
+    [['a', 'b', 'c'], ['a', 'b', 'c'], ['a', 'b', 'c']]
+    """
+    if start in cache:
+        return cache[start]
+    index = {}
+    lowlink = {}
+    values = {}
+    component = []
+    stack = []
+
+    def visit(node):
+        index[node] = lowlink[node] = len(index)
+        values[node] = own(node)
+        component.append(node)
+        stack.append((node, iter(parents.get(node, ()))))
+
+    visit(start)
+    while stack:
+        node, pending = stack[-1]
+        for parent in pending:
+            if parent in cache:
+                # Also every node of a component this walk already completed
+                values[node] = merge(values[node], cache[parent])
+            elif parent not in index:
+                visit(parent)
+                break
+            else:
+                # Visited and not cached yet: on the component being built
+                lowlink[node] = min(lowlink[node], index[parent])
+        else:
+            stack.pop()
+            if lowlink[node] == index[node]:
+                members = []
+                while not members or members[-1] != node:
+                    members.append(component.pop())
+                value = values.pop(node)
+                for member in members[:-1]:
+                    value = merge(value, values.pop(member))
+                for member in members:
+                    cache[member] = value
+            if stack:
+                child = stack[-1][0]
+                lowlink[child] = min(lowlink[child], lowlink[node])
+                if node in cache:
+                    values[child] = merge(values[child], cache[node])
+    return cache[start]
+
+class RbacOracle:
+    """Expected RBAC decisions for the users of a catalog.
+
+    Every (permission, action) pair found in the policy gets a bit, every role
+    an allow and a deny bitset. The bitsets are closed over role inheritance
+    and group ancestry once, after which a decision is two AND operations.
+    """
+
+    def __init__(self):
+        self.bits = {}
+        self.role_allow = {}
+        self.role_deny = {}
+        self.role_parents = {}
+        self.closed_roles = {}
+        self.bindings = {}
+        self.group_parents = {}
+        self.user_groups = {}
+        self.group_masks = {}
+        self.user_masks = {}
+
+    def load_catalog(self, path):
+        for _, entity in iter_entities(path):
+            self.add_entity(entity)
+
+    def add_entity(self, entity):
+        """Record the memberships and parents of a User or Group."""
+        ref = own_ref(entity)
+        spec = entity.get("spec") or {}
+        if entity["kind"] == "User":
+            groups = self.user_groups.setdefault(ref, set())
+            groups.update(entity_ref(group, "group") for group in spec.get("memberOf") or [])
+        else:
+            parents = self.group_parents.setdefault(ref, set())
+            if spec.get("parent"):
+                parents.add(entity_ref(spec["parent"], "group"))
+            for child in spec.get("children") or []:
+                self.group_parents.setdefault(entity_ref(child, "group"), set()).add(ref)
+            for member in spec.get("members") or []:
+                self.user_groups.setdefault(entity_ref(member, "user"), set()).add(ref)
+
+    def load_policy(self, path):
+        with open(path, newline="") as file:
+            for row in csv.reader(file):
+                row = [field.strip() for field in row]
+                if len(row) >= 3 and row[0] == "g":
+                    subject, role = row[1].lower(), row[2].lower()
+                    if subject.startswith("role:"):
+                        self.role_parents.setdefault(subject, set()).add(role)
+                    else:
+                        self.bindings.setdefault(subject, set()).add(role)
+                elif len(row) >= 5 and row[0] == "p":
+                    role, permission, action, effect = row[1].lower(), row[2], row[3], row[4].lower()
+                    bit = 1 << self.bits.setdefault((permission, action), len(self.bits))
+                    masks = self.role_deny if effect == "deny" else self.role_allow
+                    masks[role] = masks.get(role, 0) | bit
+
+    def _own_role_masks(self, role):
+        return self.role_allow.get(role, 0), self.role_deny.get(role, 0)
+
+    def _role_masks(self, role):
+        """Allow and deny bits of a role, including the roles it inherits."""
+        return close_over(role, self.role_parents, self._own_role_masks, self.closed_roles, merge_masks)
+
+    def _subject_masks(self, subject):
+        allow = deny = 0
+        for role in self.bindings.get(subject, ()):
+            role_allow, role_deny = self._role_masks(role)
+            allow |= role_allow
+            deny |= role_deny
+        return allow, deny
+
+    def _group_masks(self, group):
+        """Bits a group grants to its members, memoized over the group hierarchy."""
+        return close_over(group, self.group_parents, self._subject_masks, self.group_masks, merge_masks)
+
+    def user_masks_for(self, user):
+        user = entity_ref(user, "user")
+        masks = self.user_masks.get(user)
+        if masks is None:
+            allow, deny = self._subject_masks(user)
+            for group in self.user_groups.get(user, ()):
+                group_allow, group_deny = self._group_masks(group)
+                allow |= group_allow
+                deny |= group_deny
+            masks = self.user_masks[user] = (allow, deny)
+        return masks
+
+    def query_mask(self, permission=DEFAULT_PERMISSION, action=DEFAULT_ACTION, resource_type=DEFAULT_RESOURCE_TYPE):
+        mask = 0
+        for name in (permission, resource_type):
+            bit = self.bits.get((name, action))
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def decide(self, user, permission=DEFAULT_PERMISSION, action=DEFAULT_ACTION, resource_type=DEFAULT_RESOURCE_TYPE, mask=None):
+        if mask is None:
+            mask = self.query_mask(permission, action, resource_type)
+        allow, deny = self.user_masks_for(user)
+        if deny & mask:
+            return "DENY"
+        return "ALLOW" if allow & mask else "DENY"
+
+    def users(self):
+        return sorted(self.user_groups)
+
+def default_policy_file(catalog):
+    """hierarchy.py writes the policy next to its catalog, tree.py in the current folder."""
+    folder = catalog if os.path.isdir(catalog) else os.path.dirname(catalog)
+    candidate = os.path.join(folder, "rbac-policy.csv")
+    return candidate if os.path.exists(candidate) else "rbac-policy.csv"
+
+def write_results(rows, output):
+    if output.endswith(".json"):
+        with open(output, "w") as file:
+            json.dump([{"user": user, "result": result} for user, result in rows], file, indent=2)
+    else:
+        with open(output, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["user", "result"])
+            writer.writerows(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the expected RBAC decisions of a generated org offline.")
+    parser.add_argument("catalog", help="Top level Location file or folder of the generated catalog")
+    parser.add_argument("--policy", help="RBAC policy CSV (default: rbac-policy.csv next to the catalog, or in the current folder)")
+    parser.add_argument("--permission", default=DEFAULT_PERMISSION, help=f"Permission name (default: {DEFAULT_PERMISSION})")
+    parser.add_argument("--resource-type", default=DEFAULT_RESOURCE_TYPE, help=f"Resource type of the permission (default: {DEFAULT_RESOURCE_TYPE})")
+    parser.add_argument("--action", default=DEFAULT_ACTION, help=f"Permission action (default: {DEFAULT_ACTION})")
+    parser.add_argument("--users", nargs="+", help="Users to evaluate, e.g. user:default/apple_3 (default: every user of the catalog)")
+    parser.add_argument("--limit", type=int, help="Evaluate at most this many users")
+    parser.add_argument("--output", help="Write the expected results to this file, as JSON when it ends in .json and CSV otherwise")
+    args = parser.parse_args()
+
+    if args.policy is None:
+        args.policy = default_policy_file(args.catalog)
+    if not os.path.exists(args.policy):
+        print(f"ERROR: policy file {args.policy} does not exist")
+        sys.exit(1)
+
+    oracle = RbacOracle()
+    start_time = time.perf_counter()
+    oracle.load_catalog(args.catalog)
+    oracle.load_policy(args.policy)
+    loaded_time = time.perf_counter()
+
+    users = [entity_ref(user, "user") for user in args.users] if args.users else oracle.users()
+    if args.limit is not None:
+        users = users[:args.limit]
+    mask = oracle.query_mask(args.permission, args.action, args.resource_type)
+    rows = [(user, oracle.decide(user, mask=mask)) for user in users]
+    end_time = time.perf_counter()
+
+    allowed = sum(1 for _, result in rows if result == "ALLOW")
+    print(f"- Users: {len(oracle.user_groups)}, groups: {len(oracle.group_parents)}, roles: {len(set(oracle.role_allow) | set(oracle.role_deny))}")
+    print(f"- Loaded in {loaded_time - start_time:.2f} seconds")
+    print(f"- Evaluated {len(rows)} users in {end_time - loaded_time:.3f} seconds: {allowed} ALLOW, {len(rows) - allowed} DENY")
+    if args.output:
+        write_results(rows, args.output)
+    elif args.users:
+        for user, result in rows:
+            print(f"{user}: {result}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import time
+
+import aiohttp
+
+# (phase, first mark, last mark), a phase is only reported when both marks were set
+PHASES = [
+    ("dns", "dns_start", "dns_end"),
+    ("queue", "queue_start", "queue_end"),
+    ("connect", "connect_start", "connect_end"),
+    ("ttfb", "sent", "headers"),
+    ("body", "headers", "body_end"),
+    ("json", "body_end", "json_end"),
+]
+
+class RequestPhases:
+    """perf_counter marks of a single request, filled in by the trace callbacks.
+
+    Pass it as `trace_request_ctx` to the request, then mark `body_end` once
+    the body is read and `json_end` once it is decoded.
+    """
+
+    def __init__(self):
+        self.marks = {"start": time.perf_counter()}
+
+    def mark(self, name):
+        self.marks[name] = time.perf_counter()
+
+    def durations(self):
+        """Seconds spent in every phase the request went through, and in total."""
+        marks = dict(self.marks)
+        if "sent" not in marks:
+            # Older aiohttp has no headers sent signal, the request goes out
+            # once a connection is ready
+            marks["sent"] = max(marks.get(name, marks["start"]) for name in ("request_start", "dns_end", "queue_end", "connect_end"))
+        durations = {phase: marks[end] - marks[start] for phase, start, end in PHASES if start in marks and end in marks}
+        last = next((marks[name] for name in ("json_end", "body_end", "headers") if name in marks), None)
+        if last is not None:
+            durations["total"] = last - marks["start"]
+        return durations
+
+def trace_config():
+    """TraceConfig marking the phases of every request that carries a RequestPhases.
+
+    - `dns` resolving the host name, skipped when it is cached
+    - `queue` waiting for a free connection of the pool
+    - `connect` opening the TCP connection, TLS handshake included (aiohttp
+      does not signal the two apart), skipped when a connection is reused
+    - `ttfb` from the request being sent to the response headers
+    - `body` reading the response body, `json` decoding it
+    """
+    config = aiohttp.TraceConfig()
+
+    def marker(name):
+        async def callback(session, context, params):
+            phases = context.trace_request_ctx
+            if isinstance(phases, RequestPhases):
+                phases.mark(name)
+        return callback
+
+    signals = [
+        ("on_request_start", "request_start"),
+        ("on_dns_resolvehost_start", "dns_start"),
+        ("on_dns_resolvehost_end", "dns_end"),
+        ("on_connection_queued_start", "queue_start"),
+        ("on_connection_queued_end", "queue_end"),
+        ("on_connection_create_start", "connect_start"),
+        ("on_connection_create_end", "connect_end"),
+        ("on_request_headers_sent", "sent"),
+        ("on_request_end", "headers"),
+    ]
+    for signal, name in signals:
+        if hasattr(config, signal):
+            getattr(config, signal).append(marker(name))
+    return config
+
+def record_phases(recorder, endpoint, phases, user=None):
+    """Record every phase as `<endpoint>.<phase>` in a LatencyRecorder, return the total."""
+    durations = phases.durations()
+    for phase, seconds in durations.items():
+        if phase != "total":
+            recorder.record(f"{endpoint}.{phase}", seconds, user)
+    return durations.get("total", 0.0)
+
+def format_phases(recorder, endpoint, user=None):
+    """Mean of every phase and its share of the mean request time."""
+    total = recorder.histogram(endpoint, user).total
+    parts = []
+    for phase, _, _ in PHASES:
+        histogram = recorder.histograms.get((f"{endpoint}.{phase}", user))
+        if histogram is None or not histogram.count:
+            continue
+        share = f" ({histogram.total / total:.0%})" if total else ""
+        parts.append(f"{phase}: {histogram.mean():.3f}{share}")
+    return ", ".join(parts) or "no phases recorded"
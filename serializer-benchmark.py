@@ -0,0 +1,44 @@
+# This script measures how many catalog entities per second each serializer
+# backend in serializers.py can produce for the shapes the generators emit.
+#
+# Example of how to run the script:
+# python serializer-benchmark.py --entities 200000
+import argparse
+import time
+
+from serializers import SERIALIZERS, get_serializer
+
+def serialize_entities(serializer, count):
+    """Serialize `count` entities mixed the way hierarchy.py emits them."""
+    size = 0
+    for number in range(count):
+        group_name = f"carrots_{number // 4}"
+        if number % 4 == 0:
+            content = serializer.group(group_name, f"Carrots {number // 4}", f"peas_{number // 8}")
+        else:
+            content = serializer.user(
+                f"apple_{number}_{number // 4}",
+                f"apple_{number}_{number // 4}@example.com",
+                f"Apple {number} {number // 4}",
+                [group_name],
+            )
+        size += len(content)
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the catalog entity serializer backends.")
+    parser.add_argument("--entities", type=int, default=100000, help="Number of entities serialized per backend")
+    parser.add_argument("--serializer", action="append", choices=sorted(SERIALIZERS), help="Backend to benchmark, can be repeated (default: all)")
+    args = parser.parse_args()
+
+    print(f"{'serializer':<12}{'entities/sec':>15}{'MB/sec':>10}")
+    print("-" * 37)
+    for name in args.serializer or sorted(SERIALIZERS):
+        serializer = get_serializer(name)
+        start_time = time.perf_counter()
+        size = serialize_entities(serializer, args.entities)
+        elapsed = time.perf_counter() - start_time
+        print(f"{name:<12}{args.entities / elapsed:>15.0f}{size / elapsed / 1e6:>10.2f}")
+
+if __name__ == "__main__":
+    main()
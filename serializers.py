@@ -0,0 +1,173 @@
+import re
+import json
+import yaml
+
+API_VERSION = "backstage.io/v1alpha1"
+
+def group_content(name, title, parent=None, children=None):
+    # The catalog resolves children from spec.parent, so groups are written
+    # with the same empty children list the generators have always used unless
+    # extra parents (see topology.py) have to be expressed through children
+    content = {
+        "apiVersion": API_VERSION,
+        "kind": "Group",
+        "metadata": {
+            "name": name,
+            "title": title,
+        },
+        "spec": {
+            "type": "team",
+            "children": list(children or [])
+        }
+    }
+    if parent:
+        content["spec"]["parent"] = parent
+    return content
+
+def user_content(name, email, display_name, member_of):
+    return {
+        "apiVersion": API_VERSION,
+        "kind": "User",
+        "metadata": {
+            "name": name
+        },
+        "spec": {
+            "profile": {
+                "email": email,
+                "displayName": display_name,
+            },
+            "memberOf": member_of
+        }
+    }
+
+def location_content(name, targets):
+    return {
+        "apiVersion": API_VERSION,
+        "kind": "Location",
+        "metadata": {
+            "name": f"{name.lower()}",
+            "description": f"A collection of all {name.lower()}"
+        },
+        "spec": {
+            "targets": targets
+        }
+    }
+
+class YamlSerializer:
+    """Dump entities with PyYAML, using the pure Python dumper unless told otherwise."""
+
+    def __init__(self, dumper=yaml.Dumper):
+        self.dumper = dumper
+
+    def dump(self, content):
+        return yaml.dump(content, Dumper=self.dumper)
+
+    def group(self, name, title, parent=None, children=None):
+        return self.dump(group_content(name, title, parent, children))
+
+    def user(self, name, email, display_name, member_of):
+        return self.dump(user_content(name, email, display_name, member_of))
+
+    def location(self, name, targets):
+        return self.dump(location_content(name, targets))
+
+class JsonSerializer(YamlSerializer):
+    """Dump entities as single line JSON documents, which are valid YAML."""
+
+    def dump(self, content):
+        return json.dumps(content) + "\n"
+
+# Plain YAML scalars that can be written as is: they do not start with an
+# indicator, can not be read back as a number, bool or null, and are short
+# enough not to be folded by the dumper
+PLAIN_SCALAR = re.compile(r"(?:[A-Za-z<]|\./)[A-Za-z0-9_.@<>/ -]{0,60}")
+RESERVED_SCALARS = {"y", "n", "yes", "no", "true", "false", "on", "off", "null"}
+
+def yaml_scalar(value):
+    if PLAIN_SCALAR.fullmatch(value) and value[-1] != " " and value.lower() not in RESERVED_SCALARS:
+        return value
+    # Let PyYAML decide how the value has to be quoted
+    return yaml.dump([value])[2:-1]
+
+def yaml_sequence(values, indent):
+    if not values:
+        return " []\n"
+    return "\n" + "".join(f"{indent}- {yaml_scalar(value)}\n" for value in values)
+
+class TemplateSerializer:
+    """Fill precompiled templates for the fixed Group, User and Location shapes.
+
+    The output is byte-identical to `yaml.dump` of the same entity (keys sorted,
+    block style) without walking a dict through the representer.
+    """
+
+    GROUP = (
+        f"apiVersion: {API_VERSION}\n"
+        "kind: Group\n"
+        "metadata:\n"
+        "  name: {name}\n"
+        "  title: {title}\n"
+        "spec:\n"
+        "  children:{children}"
+        "{parent}"
+        "  type: team\n"
+    )
+    USER = (
+        f"apiVersion: {API_VERSION}\n"
+        "kind: User\n"
+        "metadata:\n"
+        "  name: {name}\n"
+        "spec:\n"
+        "  memberOf:{member_of}"
+        "  profile:\n"
+        "    displayName: {display_name}\n"
+        "    email: {email}\n"
+    )
+    LOCATION = (
+        f"apiVersion: {API_VERSION}\n"
+        "kind: Location\n"
+        "metadata:\n"
+        "  description: {description}\n"
+        "  name: {name}\n"
+        "spec:\n"
+        "  targets:{targets}"
+    )
+
+    def dump(self, content):
+        # Any other document (copied or edited entities) goes through the
+        # dumper the templates are byte-identical to
+        return yaml.dump(content)
+
+    def group(self, name, title, parent=None, children=None):
+        return self.GROUP.format(
+            name=yaml_scalar(name),
+            title=yaml_scalar(title),
+            children=yaml_sequence(children or [], "  "),
+            parent=f"  parent: {yaml_scalar(parent)}\n" if parent else "",
+        )
+
+    def user(self, name, email, display_name, member_of):
+        return self.USER.format(
+            name=yaml_scalar(name),
+            email=yaml_scalar(email),
+            display_name=yaml_scalar(display_name),
+            member_of=yaml_sequence(member_of, "  "),
+        )
+
+    def location(self, name, targets):
+        return self.LOCATION.format(
+            name=yaml_scalar(name.lower()),
+            description=yaml_scalar(f"A collection of all {name.lower()}"),
+            targets=yaml_sequence(targets, "  "),
+        )
+
+SERIALIZERS = {
+    "yaml": YamlSerializer,
+    "template": TemplateSerializer,
+    "json": JsonSerializer,
+}
+if getattr(yaml, "CSafeDumper", None) is not None:
+    SERIALIZERS["cyaml"] = lambda: YamlSerializer(yaml.CSafeDumper)
+
+def get_serializer(name="yaml"):
+    return SERIALIZERS[name]()
@@ -0,0 +1,102 @@
+import os
+import re
+import json
+import hashlib
+
+# Blobs are named by their sha256 key, other files (graph_store's index) are left alone
+BLOB_NAME = re.compile(r"([0-9a-f]{64})\.\w+")
+
+class ShardCache:
+    """Content-addressed cache of the shards (one per root group) of a generated org.
+
+    Every shard is identified by a key hashed from the seed, the root index and
+    the parameters that shape it. The manifest records which key is currently
+    written to disk for each root together with its stats and file list, so a
+    re-run only rewrites the roots whose key changed. Blobs that let a shard be
+    rebuilt without regenerating it are stored next to the manifest, named by key.
+    Only the key in the manifest is ever looked up, so `prune` drops the blobs
+    of every other key once the manifest is saved.
+    """
+
+    def __init__(self, directory, load_manifest=True):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.manifest = {}
+        if load_manifest and os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as file:
+                self.manifest = json.load(file)
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def lookup(self, kind, root_number, key, blob=None):
+        """Return the manifest entry of `kind` for a root if it was written with `key`.
+
+        The entry only counts when its files, and the `blob` suffixed blob it is
+        rebuilt from when one is given, are still on disk.
+        """
+        entry = self.manifest.get(kind, {}).get(str(root_number))
+        if entry is None or entry["key"] != key:
+            return None
+        if not all(os.path.exists(path) for path in entry.get("files", [])):
+            return None
+        if blob is not None and not os.path.exists(self.blob_path(key, blob)):
+            return None
+        return entry
+
+    def store(self, kind, root_number, entry):
+        self.manifest.setdefault(kind, {})[str(root_number)] = entry
+
+    def discard(self, kind, root_number):
+        """Forget a root's shard and remove the files that were written for it."""
+        entry = self.manifest.get(kind, {}).pop(str(root_number), None)
+        if entry is None:
+            return
+        for path in entry.get("files", []):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def entries(self, kind):
+        return {int(root_number): entry for root_number, entry in self.manifest.get(kind, {}).items()}
+
+    def blob_path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def read_blob(self, key, suffix, mode="rb"):
+        path = self.blob_path(key, suffix)
+        if not os.path.exists(path):
+            return None
+        with open(path, mode, newline="" if "b" not in mode else None) as file:
+            return file.read()
+
+    def write_blob(self, key, suffix, data):
+        os.makedirs(self.directory, exist_ok=True)
+        mode = "wb" if isinstance(data, bytes) else "w"
+        with open(self.blob_path(key, suffix), mode, newline="" if mode == "w" else None) as file:
+            file.write(data)
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.manifest_path, "w") as file:
+            json.dump(self.manifest, file, indent=2)
+
+    def prune(self):
+        """Remove the blobs no manifest entry refers to, return how many were removed."""
+        if not os.path.isdir(self.directory):
+            return 0
+        keys = {entry["key"] for entries in self.manifest.values() for entry in entries.values()}
+        removed = 0
+        for name in os.listdir(self.directory):
+            match = BLOB_NAME.fullmatch(name)
+            if match and match.group(1) not in keys:
+                os.remove(os.path.join(self.directory, name))
+                removed += 1
+        return removed
+
+    def clear(self):
+        """Drop the manifest and the blobs, e.g. after an unseeded run overwrote the shards."""
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        self.prune()
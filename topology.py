@@ -0,0 +1,168 @@
+# This script generates orgs with the group shapes that make catalog relation
+# processing and RBAC group membership resolution slow, which neither tree.py
+# (random shallow trees) nor hierarchy.py (perfect binary trees) produce:
+#
+# - chain         every group is the parent of the next one, one deep line
+# - wide          a single root with every other group as its direct child
+# - diamond       stacked diamonds, each bottom group has two parents
+# - multi-parent  every group gets up to --parents parents among the earlier groups
+# - cycle         the parent of the first group is the last one
+# - membership    a wide org whose users are members of --memberships-per-user groups each
+#
+# Extra parents are written as `children` of the additional parent groups, the
+# main parent as `spec.parent`. Every group gets a role, shaped by the policy
+# options, so a user resolves the roles of every group it can reach.
+#
+# Example of how to run the script:
+# python topology.py chain -g 1000 -u 100
+# python topology.py membership -g 500 -u 1000 --memberships-per-user 300 --group-sizes zipf
+import random
+import argparse
+
+from entity_writer import EntityWriter
+from serializers import SERIALIZERS, get_serializer
+from output_packing import entities_per_file, plan_locations, write_location_tree
+from policy_model import PolicyModel, add_policy_arguments
+from membership import MembershipModel, add_membership_arguments
+
+FRUITS = ["apple", "banana", "cherry", "grapefruit", "strawberry", "plum", "raspberry", "mango", "pineapple", "papaya", "blueberry", "pomegranate", "guava", "orange", "apricot", "watermelon", "peach", "pear", "blackberry", "lime", "date", "elderberry", "fig", "grape", "kiwi", "lemon", "cantaloupe", "melon", "breadfruit", "starfruit"]
+
+FOLDER_STRUCTURE = "catalog-entities/{topology}-org"
+DEFAULT_ENTITIES_PER_FILE = 1000
+DEFAULT_MEMBERSHIPS_PER_USER = {"membership": 100}
+
+class Group:
+    """A generated group, its main parent and the groups that list it as an extra child."""
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        self.extra_children = []
+
+def chain(names, args):
+    return [(name, names[index - 1] if index else None, []) for index, name in enumerate(names)]
+
+def wide(names, args):
+    return [(name, names[0] if index else None, []) for index, name in enumerate(names)]
+
+def diamond(names, args):
+    # top -> left, right -> next top, the next top is also a child of right
+    edges = []
+    for index, name in enumerate(names):
+        if index == 0:
+            edges.append((name, None, []))
+        elif index % 3 == 0:
+            edges.append((name, names[index - 2], [names[index - 1]]))
+        else:
+            edges.append((name, names[index - index % 3], []))
+    return edges
+
+def multi_parent(names, args):
+    edges = []
+    for index, name in enumerate(names):
+        if index == 0:
+            edges.append((name, None, []))
+            continue
+        parents = random.sample(names[:index], min(args.parents, index))
+        edges.append((name, parents[0], parents[1:]))
+    return edges
+
+def cycle(names, args):
+    return [(name, names[index - 1], []) for index, name in enumerate(names)]
+
+TOPOLOGIES = {
+    "chain": chain,
+    "wide": wide,
+    "diamond": diamond,
+    "multi-parent": multi_parent,
+    "cycle": cycle,
+    "membership": wide,
+}
+
+def build_groups(args):
+    groups = {}
+    for root in range(args.root):
+        names = [f"{args.topology}_{root}_{index}" for index in range(args.groups)]
+        for name, parent, extra_parents in TOPOLOGIES[args.topology](names, args):
+            groups[name] = Group(name, parent)
+            for extra_parent in extra_parents:
+                groups[extra_parent].extra_children.append(name)
+    for group in groups.values():
+        if group.parent is not None:
+            groups[group.parent].children.append(group.name)
+    return groups
+
+def build_users(args, group_names):
+    membership = MembershipModel.from_args(args)
+    member_lists = membership.memberships(membership.primaries(len(group_names), args.users), len(group_names))
+    for number, member_of in enumerate(member_lists):
+        fruit = FRUITS[number % len(FRUITS)]
+        yield f"{fruit}_{number}", f"{fruit}-{number}@example.com", f"{fruit.capitalize()} {number}", [group_names[index] for index in member_of]
+
+def children_of(group):
+    # Only groups with extra children list their children, every one of them
+    # so the list agrees with the parent of each child
+    if not group.extra_children:
+        return []
+    return group.children + group.extra_children
+
+def write_catalog(args, groups, serializer):
+    folder = FOLDER_STRUCTURE.format(topology=args.topology)
+    group_names = list(groups)
+    with EntityWriter(mode="w") as writer:
+        streams = {"groups": [], "users": []}
+        per_file = args.entities_per_file or entities_per_file(len(groups), args.files) or DEFAULT_ENTITIES_PER_FILE
+        for group in groups.values():
+            content = serializer.group(group.name, group.name.replace("_", " ").capitalize(), group.parent, children_of(group))
+            name = writer.write_packed(f"{folder}/groups", "groups", content, per_file)
+            if not streams["groups"] or streams["groups"][-1] != name:
+                streams["groups"].append(name)
+
+        per_file = args.entities_per_file or entities_per_file(args.users, args.files) or DEFAULT_ENTITIES_PER_FILE
+        for user in build_users(args, group_names):
+            name = writer.write_packed(f"{folder}/users", "users", serializer.user(*user), per_file)
+            if not streams["users"] or streams["users"][-1] != name:
+                streams["users"].append(name)
+
+        for stream, files in streams.items():
+            targets, intermediates = plan_locations(stream, files, args.location_fanout)
+            write_location_tree(serializer, writer, f"{folder}/{stream}", intermediates)
+            writer.handle(f"{folder}/{stream}/{stream}.local.yaml").write(serializer.location(stream, [f"./{target}.local.yaml" for target in targets]))
+        writer.handle(f"{folder}/all.local.yaml").write(serializer.location("entities", [f"./{stream}/{stream}.local.yaml" for stream in streams]))
+
+        policy = PolicyModel.from_args(args) or PolicyModel()
+        policy.write(writer.handle(f"{folder}/rbac-policy.csv", newline=""), group_names)
+    return writer, policy
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate orgs with pathological group topologies.")
+    parser.add_argument("topology", choices=sorted(TOPOLOGIES), help="Shape of the group graph")
+    parser.add_argument("-r", "--root", type=int, default=1, help="Number of independent group graphs")
+    parser.add_argument("-g", "--groups", type=int, default=100, help="Number of groups in every graph")
+    parser.add_argument("-u", "--users", type=int, default=100, help="Number of users")
+    parser.add_argument("--parents", type=int, default=2, help="Parents of every group in the multi-parent topology")
+    parser.add_argument("-s", "--seed", type=int, default=None, help="Seed for reproducible output")
+    parser.add_argument("--serializer", choices=sorted(SERIALIZERS), default="yaml", help="Backend used to serialize the catalog entities")
+    parser.add_argument("--entities-per-file", type=int, default=0, help=f"Pack this many users or groups into each file (default: {DEFAULT_ENTITIES_PER_FILE})")
+    parser.add_argument("--files", type=int, default=0, help="Spread the users and the groups over this many files each")
+    parser.add_argument("--location-fanout", type=int, default=0, help="Maximum number of targets per Location, larger lists become nested Locations")
+    add_policy_arguments(parser)
+    add_membership_arguments(parser)
+
+    args = parser.parse_args()
+    if args.memberships_per_user is None:
+        args.memberships_per_user = DEFAULT_MEMBERSHIPS_PER_USER.get(args.topology, 1)
+    random.seed(args.seed)
+
+    groups = build_groups(args)
+    writer, policy = write_catalog(args, groups, get_serializer(args.serializer))
+
+    print(f"- The number of groups: {len(groups)}")
+    print(f"- The number of users: {args.users}")
+    print(f"- The number of roles: {policy.roles}")
+    print(f"- The number of permissions: {policy.permissions}")
+    print(f"- Entities written per second: {writer.entities_per_second():.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 import os
 import random
-import yaml
 import argparse
 import csv
 
+from entity_writer import EntityWriter
+from serializers import SERIALIZERS, get_serializer
+from output_packing import entities_per_file, plan_locations, write_location_tree
+from policy_model import PolicyModel, add_policy_arguments
+from membership import MembershipModel, add_membership_arguments
+
 FRUITS = ["apple", "banana", "cherry", "grapefruit", "strawberry", "plum", "raspberry", "mango", "pineapple", "papaya", "blueberry", "pomegranate", "guava", "orange", "apricot", "watermelon", "peach", "pear", "blackberry", "lime", "date", "elderberry", "fig", "grape", "kiwi", "lemon", "cantaloupe", "melon", "breadfruit", "starfruit"]
 
 VEGETABLES = ["carrots", "peas", "tomatoes", "onions", "peppers", "mushrooms", "cucumbers", "gourds", "leeks", "parsnips", "potatoes", "pumpkins", "shallots", "zucchinis", "turnips"]
@@ -15,9 +20,12 @@ BASE_USER_FOLDER_STRUCTURE = "catalog-entities/large-org/"
 
 GROUP_CHOICES = []
 USER_CHOICES = []
+ROOT_GROUPS = []
 LOCATIONS = ["users", "groups"]
 LOCATIONS_CHOICES = [USER_CHOICES, GROUP_CHOICES]
 
+SERIALIZER = get_serializer()
+
 PERMISSIONS = [
     [" catalog-entity", " read", " allow"],
     [" catalog-entity", " update", " allow"],
@@ -28,7 +36,29 @@ PERMISSIONS = [
 def generate_random_name(items):
     return random.choice(items)
 
-def generate_user_yaml_content(name, number, group):
+class Group:
+    """A Group entity linked to its parent and children by name."""
+    kind = "Group"
+
+    def __init__(self, name, title, root_group, parent=None):
+        self.name = name
+        self.title = title
+        self.root_group = root_group
+        self.parent = parent
+        self.children = []
+        self.members = []
+
+class User:
+    """A User entity and the names of the groups it is a member of."""
+    kind = "User"
+
+    def __init__(self, name, email, display_name, member_of):
+        self.name = name
+        self.email = email
+        self.display_name = display_name
+        self.member_of = member_of
+
+def create_user(name, number, group):
     memberOf = group
     if number:
         username = f"{name.lower()}_{number}"
@@ -38,76 +68,44 @@ def generate_user_yaml_content(name, number, group):
         username = name
         email = f"{name}@example.com"
         displayName = f"{name}"
-    content = {
-        "apiVersion": "backstage.io/v1alpha1",
-        "kind": "User",
-        "metadata": {
-            "name": username
-        },
-        "spec": {
-            "profile": {
-                "email": email,
-                "displayName": displayName,
-            },
-            "memberOf": memberOf
-        }
-    }
-    return yaml.dump(content)
-
-def generate_group_yaml_content(name, number, root_number, parent_group=None):
-    content = {
-        "apiVersion": "backstage.io/v1alpha1",
-        "kind": "Group",
-        "metadata": {
-            "name": f"{name.lower()}_{number}_{root_number}",
-            "title": f"{name.capitalize()} {number} {root_number}"
-        },
-        "spec": {
-            "type": "team",
-            "children": []
-        }
-    }
-    if parent_group:
-        content["spec"]["parent"] = parent_group.lower()
-    return yaml.dump(content)
+    return User(username, email, displayName, memberOf)
+
+def create_group(name, number, root_number, root_group, parent_group=None):
+    group_name = f"{name.lower()}_{number}_{root_number}"
+    title = f"{name.capitalize()} {number} {root_number}"
+    return Group(group_name, title, root_group, parent_group.lower() if parent_group else None)
+
+def generate_user_yaml_content(user):
+    return SERIALIZER.user(user.name, user.email, user.display_name, user.member_of)
+
+def generate_group_yaml_content(group):
+    return SERIALIZER.group(group.name, group.title, group.parent)
 
 def generate_location_yaml_content(name, children):
     folder = f"/{name}/"
     ex = ".local.yaml"
     for i in range(len(children)):
       children[i] = f".{folder}{children[i]}{ex}"
-    content = {
-        "apiVersion": "backstage.io/v1alpha1",
-        "kind": "Location",
-        "metadata": {
-            "name": f"{name.lower()}",
-            "description": f"A collection of all {name.lower()}"
-        },
-        "spec": {
-            "targets": children
-        }
-    }
-    return yaml.dump(content)
+    return SERIALIZER.location(name, children)
 
 def draw_hierarchy_tree(group_hierarchy, node, indent=0, file=None):
     if node not in group_hierarchy:
         return
 
     current_node = group_hierarchy[node]
-    node_type = current_node["kind"]
+    node_type = current_node.kind
     if node_type == "Group":
-        line = "|  " * indent + "|- group:default/" + current_node["metadata"]["name"]
+        line = "|  " * indent + "|- group:default/" + current_node.name
         print(line)
         file.write(line + "\n")
-        children = current_node["spec"]["children"]
+        children = current_node.children
         for child in children:
             draw_hierarchy_tree(group_hierarchy, child, indent + 1, file)
         # Print associated users for this group
-        for user_node in group_hierarchy.values():
-            if user_node["kind"] == "User" and current_node["metadata"]["name"] in user_node["spec"]["memberOf"]:
-                line = "|  " * (indent + 1) + "|- user:default/" + user_node["metadata"]["name"]
-                print(line)
-                file.write(line + "\n")
+        for user_name in current_node.members:
+            line = "|  " * (indent + 1) + "|- user:default/" + user_name
+            print(line)
+            file.write(line + "\n")
     elif node_type == "User":
         # User nodes are already handled when printing associated groups, so no need to print here
         pass
@@ -115,23 +113,12 @@ def draw_hierarchy_tree(group_hierarchy, node, indent=0, file=None):
 
 def draw_hierarchy_ascii(group_hierarchy):
     with open("hierarchy_graph.txt", "w") as file:
-        root_nodes = [node for node, data in group_hierarchy.items() if "parent" not in data["spec"] and "User" not in data["kind"]]
-        for root_node in root_nodes:
+        for root_node in ROOT_GROUPS:
             draw_hierarchy_tree(group_hierarchy, root_node, file=file)
             line = "-------------------------------------------------------------------"
             print(line)
             file.write(line + "\n")
 
-def save_yaml_file_for_group(parent_group_name, content, folder_structure, location):
-    if location:
-        filename = f"{folder_structure}/{parent_group_name}.local.yaml"
-    else:
-        filename = f"{folder_structure}/{parent_group_name}.local.yaml"
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, "a") as file:
-        file.write(content)
-        file.write("---\n")
-
 def save_user_yaml_file(name, content, number, folder_structure, location):
     if location:
         filename = f"{folder_structure}/{name.lower()}.local.yaml"
@@ -147,54 +134,98 @@ def save_user_yaml_file_for_group(group_name, content, folder_structure, locatio
     else:
         filename = f"{folder_structure}/{group_name}.local.yaml"
     os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, "a") as file:
+    with open(filename, "w") as file:
         file.write(content)
         file.write("---\n")
 
 def create_resources(args):
     group_hierarchy = {}
-    user_choices = []
     root_choices = []
     for root_number in range(args.root):
-      root_hierarchy = {}
+      root_hierarchy = []
       root_group = ""
       for group_number in range(args.groups):
           vegetable_name = generate_random_name(VEGETABLES)
-          parent_group = random.choice(list(root_hierarchy.keys())) if root_hierarchy else None
-          group_yaml_content = generate_group_yaml_content(vegetable_name, group_number, root_number, parent_group)
+          parent_group = random.choice(root_hierarchy) if root_hierarchy else None
           if parent_group == None:
               root_group = vegetable_name + "_" + str(group_number) + "_" + str(root_number)
-          save_yaml_file_for_group(root_group, group_yaml_content, GROUP_FOLDER_STRUCTURE, False)
+          group = create_group(vegetable_name, group_number, root_number, root_group, parent_group)
           if parent_group:
-              root_hierarchy[parent_group]["spec"]["children"].append(vegetable_name.lower() + "_" + str(group_number) + "_" + str(root_number))
-              group_hierarchy[parent_group]["spec"]["children"].append(vegetable_name.lower() + "_" + str(group_number) + "_" + str(root_number))
-          group_hierarchy[vegetable_name.lower() + "_" + str(group_number) + "_" + str(root_number)] = yaml.safe_load(group_yaml_content)
-          root_hierarchy[vegetable_name.lower() + "_" + str(group_number) + "_" + str(root_number)] = yaml.safe_load(group_yaml_content)
+              group_hierarchy[parent_group].children.append(group.name)
+          else:
+              ROOT_GROUPS.append(group.name)
+          group_hierarchy[group.name] = group
+          root_hierarchy.append(group.name)
           if root_group not in GROUP_CHOICES:
               GROUP_CHOICES.append(f"{root_group}")
           root_choices.append(f"{vegetable_name}_{group_number}_{root_number}")
 
+    membership = MembershipModel.from_args(args)
+    if membership is not None:
+        member_lists = membership.memberships(membership.primaries(len(root_choices), args.users), len(root_choices))
     for user_number in range(args.users):
         fruit_name = generate_random_name(FRUITS)
-        group_choice = random.choice(root_choices)
-        user_yaml_content = generate_user_yaml_content(fruit_name, user_number, [group_choice])
-        save_user_yaml_file_for_group(group_choice, user_yaml_content, USER_FOLDER_STRUCTURE, False)
-        user_choices.append(f"{fruit_name.lower()}_{user_number}")
-        group_hierarchy[fruit_name.lower() + "_" + str(user_number)] = yaml.safe_load(user_yaml_content)
+        if membership is None:
+            member_of = [random.choice(root_choices)]
+        else:
+            member_of = [root_choices[index] for index in member_lists[user_number]]
+        group_choice = member_of[0]
+        user = create_user(fruit_name, user_number, member_of)
+        group_hierarchy[user.name] = user
+        for group_name in member_of:
+            group_hierarchy[group_name].members.append(user.name)
         if group_choice not in USER_CHOICES:
             USER_CHOICES.append(f"{group_choice}")
 
-    for i in range(len(LOCATIONS)):
-        location_yaml_content = generate_location_yaml_content(LOCATIONS[i], LOCATIONS_CHOICES[i])
-        save_user_yaml_file(LOCATIONS[i], location_yaml_content, 1, LOCATION_FOLDER_STRUCTURE, True)
+    save_resources(group_hierarchy, args)
+
+    with EntityWriter(mode="w") as location_writer:
+        for i in range(len(LOCATIONS)):
+            targets, intermediates = plan_locations(LOCATIONS[i], LOCATIONS_CHOICES[i], args.location_fanout)
+            write_location_tree(SERIALIZER, location_writer, f"{LOCATION_FOLDER_STRUCTURE}/{LOCATIONS[i]}", intermediates)
+            LOCATIONS_CHOICES[i][:] = targets
+            location_yaml_content = generate_location_yaml_content(LOCATIONS[i], LOCATIONS_CHOICES[i])
+            save_user_yaml_file(LOCATIONS[i], location_yaml_content, 1, LOCATION_FOLDER_STRUCTURE, True)
     
     return group_hierarchy
 
-def save_to_csv(group_hierarchy):
+def save_resources(group_hierarchy, args):
+    """Serialize every generated entity into its group or user file.
+
+    When packing is enabled the entities are written in order into numbered
+    pack files instead, and the Location choices are replaced by those files.
+    """
+    users_per_file = args.entities_per_file or entities_per_file(args.users, args.files)
+    groups_per_file = args.entities_per_file or entities_per_file(args.groups * args.root, args.files)
+    if users_per_file:
+        USER_CHOICES.clear()
+    if groups_per_file:
+        GROUP_CHOICES.clear()
+    with EntityWriter(mode="w") as writer:
+        for entity in group_hierarchy.values():
+            if entity.kind == "Group" and groups_per_file:
+                name = writer.write_packed(GROUP_FOLDER_STRUCTURE, "groups", generate_group_yaml_content(entity), groups_per_file)
+                if not GROUP_CHOICES or GROUP_CHOICES[-1] != name:
+                    GROUP_CHOICES.append(name)
+            elif entity.kind == "Group":
+                filename = f"{GROUP_FOLDER_STRUCTURE}/{entity.root_group}.local.yaml"
+                writer.write_entity(filename, generate_group_yaml_content(entity))
+            elif users_per_file:
+                name = writer.write_packed(USER_FOLDER_STRUCTURE, "users", generate_user_yaml_content(entity), users_per_file)
+                if not USER_CHOICES or USER_CHOICES[-1] != name:
+                    USER_CHOICES.append(name)
+            else:
+                filename = f"{USER_FOLDER_STRUCTURE}/{entity.member_of[0]}.local.yaml"
+                writer.write_entity(filename, generate_user_yaml_content(entity))
+
+def save_to_csv(group_hierarchy, policy_model=None):
     with open("rbac-policy.csv", mode="w", newline="") as file:
+        if policy_model is not None:
+            # Every group is a candidate for roles, in the order they were generated
+            policy_model.write(file, (name for name, entity in group_hierarchy.items() if entity.kind == "Group"))
+            return
         writer = csv.writer(file)
-        root_nodes = [node for node, data in group_hierarchy.items() if "parent" not in data["spec"] and "User" not in data["kind"]]
-        for root_node in root_nodes:
+        for root_node in ROOT_GROUPS:
             levels_encountered = [False] * 4
             csv_hierarchy_tree(group_hierarchy, root_node, writer, 0, levels_encountered)
             writer.writerow([])
@@ -209,12 +240,12 @@ def csv_hierarchy_tree(group_hierarchy, node, writer, current_level, levels_enco
         return
 
     current_node = group_hierarchy[node]
-    node_type = current_node["kind"]
+    node_type = current_node.kind
     if node_type == "Group":
-        writer.writerow(["g", " group:default/" + current_node["metadata"]["name"], " role:default/" + current_node["metadata"]["name"]])
-        writer.writerow(["p", " role:default/" + current_node["metadata"]["name"], *permission])
+        writer.writerow(["g", " group:default/" + current_node.name, " role:default/" + current_node.name])
+        writer.writerow(["p", " role:default/" + current_node.name, *permission])
         levels_encountered[current_level] = True
-        children = current_node["spec"]["children"]
+        children = current_node.children
         for child in children:
             csv_hierarchy_tree(group_hierarchy, child, writer, current_level + 1, levels_encountered)
     elif node_type == "User":
@@ -223,17 +254,16 @@ def csv_hierarchy_tree(group_hierarchy, node, writer, current_level, levels_enco
 def add_user_to_last_group_first_branch(group_hierarchy, number_of_attached_groups):
     current_level = number_of_attached_groups
     last_group_list = []
-    root_nodes = [node for node, data in group_hierarchy.items() if "parent" not in data["spec"] and "User" not in data["kind"]]
-    for root_node in root_nodes:
+    for root_node in ROOT_GROUPS:
         if current_level == 0:
             return
         current_level -= 1
         last_group = find_last_group_first_branch(group_hierarchy, root_node)
-        last_group_name = last_group["metadata"]["name"]
+        last_group_name = last_group.name
         last_group_list.append(last_group_name)
-        user_yaml_content = generate_user_yaml_content(f"<YOUR_USERNAME_{current_level}>", None, last_group_name)
-        group_hierarchy[f"<YOUR_USERNAME_{current_level}>"] = yaml.safe_load(user_yaml_content)
-    user_yaml_content = generate_user_yaml_content(f"<YOUR_USERNAME_{current_level}>", None, last_group_list)
+        group_hierarchy[f"<YOUR_USERNAME_{current_level}>"] = create_user(f"<YOUR_USERNAME_{current_level}>", None, [last_group_name])
+        last_group.members.append(f"<YOUR_USERNAME_{current_level}>")
+    user_yaml_content = generate_user_yaml_content(create_user(f"<YOUR_USERNAME_{current_level}>", None, last_group_list))
     save_user_yaml_file_for_group("base-user", user_yaml_content, BASE_USER_FOLDER_STRUCTURE, True)
 
 def find_last_group_first_branch(group_hierarchy, node):
@@ -241,9 +271,9 @@ def find_last_group_first_branch(group_hierarchy, node):
         return None
     
     current_node = group_hierarchy[node]
-    node_type = current_node["kind"]
+    node_type = current_node.kind
     if node_type == "Group":
-        children = current_node["spec"]["children"]
+        children = current_node.children
         if children:
             # Recursively traverse the first child
             return find_last_group_first_branch(group_hierarchy, children[0])
@@ -261,14 +291,24 @@ def main():
     parser.add_argument("-u", "--users", type=int, default=2, help="Number of Users")
     parser.add_argument("-r", "--root", type=int, default=2, help="Number of Root Groups")
     parser.add_argument("-z", "--roles", type=int, default=1, help="Number of roles the base user is attached to")
+    parser.add_argument("-s", "--seed", type=int, default=None, help="Seed for reproducible output")
+    parser.add_argument("--serializer", choices=sorted(SERIALIZERS), default="yaml", help="Backend used to serialize the catalog entities")
+    parser.add_argument("--entities-per-file", type=int, default=0, help="Pack this many users or groups into each file instead of one file per group")
+    parser.add_argument("--files", type=int, default=0, help="Spread the users and the groups over this many files each")
+    add_policy_arguments(parser)
+    add_membership_arguments(parser)
+    parser.add_argument("--location-fanout", type=int, default=0, help="Maximum number of targets per Location, larger lists become nested Locations")
 
     args = parser.parse_args()
+    random.seed(args.seed)
+    global SERIALIZER
+    SERIALIZER = get_serializer(args.serializer)
     group_hierarchy = create_resources(args)
 
     add_user_to_last_group_first_branch(group_hierarchy, args.roles)
 
     draw_hierarchy_ascii(group_hierarchy)
-    save_to_csv(group_hierarchy)
+    save_to_csv(group_hierarchy, PolicyModel.from_args(args))
 
 if __name__ == "__main__":
     main()